@@ -0,0 +1,76 @@
+"""
+Stress test storing options for thousands of first time users, committing every row on its own against batching them
+through a WriteBehindBuffer
+
+Usage: python -m benchmarks.first_time_users --users 5000
+"""
+
+from argparse import ArgumentParser
+from asyncio import get_event_loop
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import create_engine, Column, Integer, Text
+from sqlalchemy.ext.declarative import declarative_base
+
+from utils.database import AsyncDatabase, WriteBehindBuffer
+
+
+Base = declarative_base()
+
+
+class UserOptions(Base):
+    __tablename__ = "user_options"
+    UserId = Column(Integer, primary_key=True)
+    DefaultMCPMinecraftVersion = Column(Text, default="latest")
+
+
+def insert(session, user_id: int):
+    session.add(UserOptions(UserId=user_id))
+
+
+async def commit_each(database: AsyncDatabase, users: int):
+    for user_id in range(users):
+        await database.run(insert, user_id)
+
+
+async def write_behind(database: AsyncDatabase, users: int, batch: int):
+    buffer = WriteBehindBuffer(database, interval=0)
+    for user_id in range(users):
+        buffer.queue(UserOptions(UserId=user_id, DefaultMCPMinecraftVersion="latest"))
+        if len(buffer) >= batch:
+            await buffer.flush()
+    await buffer.flush()
+
+
+def run(path: Path, users: int, coroutine) -> float:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    database = AsyncDatabase(engine)
+    start = perf_counter()
+    get_event_loop().run_until_complete(coroutine(database, users))
+    elapsed = perf_counter() - start
+    count = database.run_sync(lambda session: session.query(UserOptions).count())
+    assert count == users, f"Expected {users} rows but found {count}"
+    database.shutdown()
+    engine.dispose()
+    return elapsed
+
+
+def main():
+    parser = ArgumentParser(description="Stress test first time user inserts")
+    parser.add_argument("--users", type=int, default=5000, help="The number of first time users")
+    parser.add_argument("--batch", type=int, default=500, help="The rows queued between write-behind flushes")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        each = run(Path(directory) / "each.db", args.users, commit_each)
+        batched = run(Path(directory) / "batched.db", args.users,
+                      lambda database, users: write_behind(database, users, args.batch))
+    print(f"Commit per user: {each:.2f}s ({args.users / each:.0f} users/s)")
+    print(f"Write-behind:    {batched:.2f}s ({args.users / batched:.0f} users/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare loading a mapping database with the old deserializer, which checked every spelling of every registered class on
+each object, against the dispatch table
+
+Usage: python -m benchmarks.json_loads --classes 5000
+       python -m benchmarks.json_loads --path mappings/1.16.5/db.json
+"""
+
+from argparse import ArgumentParser
+from json import loads
+from pathlib import Path
+from time import perf_counter
+
+from benchmarks.mappings import build_classes
+from utils.json import Json, _serializers
+
+
+def legacy_deserialize(o):
+    for name, serializer in _serializers.items():
+        if f"_{name}_" in o.keys():
+            return serializer.deserialize(o[f"_{name}_"])
+        if f"_{serializer.__name__}_" in o.keys():
+            return serializer.deserialize(o[f"_{serializer.__name__}_"])
+        if f"__{name}__" in o.keys():
+            return serializer.deserialize(o[f"__{name}__"])
+        if f"__{serializer.__name__}__" in o.keys():
+            return serializer.deserialize(o[f"__{serializer.__name__}__"])
+    return o
+
+
+def build_database(count: int) -> str:
+    return Json.dumps({"mc_version": "1.16.5", "snapshot": "20210309", "classes": build_classes(count, 10, 15, 2)},
+                      separators=(',', ':'))
+
+
+def best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark loading a mapping database")
+    parser.add_argument("--classes", type=int, default=5000, help="The number of classes in the generated database")
+    parser.add_argument("--path", type=Path, help="A db.json to load instead of a generated database")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of times to load the database")
+    args = parser.parse_args()
+
+    text = args.path.read_text() if args.path is not None else build_database(args.classes)
+    print(f"Loading {len(text) / (1024 * 1024):.1f} MB of JSON")
+
+    results = {
+        "json.loads (no hook)": best_of(args.repeat, lambda: loads(text)),
+        "legacy deserializer": best_of(args.repeat, lambda: loads(text, object_hook=legacy_deserialize)),
+        "Json.loads": best_of(args.repeat, lambda: Json.loads(text))
+    }
+    for name, elapsed in results.items():
+        print(f"{name:<22} {elapsed * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
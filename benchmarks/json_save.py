@@ -0,0 +1,56 @@
+"""
+Compare the time and peak memory of saving a mapping database by building the whole document with Json.dumps against
+streaming it with Json.stream
+
+Usage: python -m benchmarks.json_save --classes 5000
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import start, stop, get_traced_memory, reset_peak
+
+from benchmarks.mappings import build_classes
+from utils import atomic_write
+from utils.json import Json
+
+
+def save_dumps(path: Path, document: dict):
+    path.write_text(Json.dumps(document, separators=(',', ':')))
+
+
+def save_stream(path: Path, document: dict):
+    with atomic_write(path) as f:
+        Json.stream(document, f, separators=(',', ':'))
+
+
+def measure(func, path: Path, document: dict):
+    started = perf_counter()
+    func(path, document)
+    elapsed = perf_counter() - started
+    # Measured in a second run, as tracing slows every allocation down
+    start()
+    reset_peak()
+    func(path, document)
+    peak = get_traced_memory()[1]
+    stop()
+    return elapsed, peak
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark saving a mapping database")
+    parser.add_argument("--classes", type=int, default=5000, help="The number of classes in the generated database")
+    args = parser.parse_args()
+
+    document = {"mc_version": "1.16.5", "snapshot": "20210309", "classes": build_classes(args.classes, 10, 15, 2)}
+    with TemporaryDirectory() as directory:
+        for name, func in (("Json.dumps + write_text", save_dumps), ("Json.stream", save_stream)):
+            path = Path(directory) / "db.json"
+            elapsed, peak = measure(func, path, document)
+            print(f"{name:<24} {elapsed * 1000:>10.1f} ms {peak / (1024 * 1024):>8.1f} MB peak "
+                  f"({path.stat().st_size / (1024 * 1024):.1f} MB written)")
+
+
+if __name__ == "__main__":
+    main()
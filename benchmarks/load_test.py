@@ -0,0 +1,65 @@
+"""
+Load test the website API and report latency percentiles and throughput
+
+Usage: python benchmarks/load_test.py --url "http://localhost:8080/api/mcp?s=tick" --concurrency 16 --requests 2000
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from requests import Session
+
+
+def percentile(values, percent: float) -> float:
+    """
+    Get the given percentile of a sorted list of values
+
+    :param values: The sorted values
+    :param percent: The percentile to get, between 0 and 100
+    :return: The value at that percentile
+    """
+    if len(values) == 0:
+        return 0.0
+    index = min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def worker(url: str, count: int):
+    latencies = []
+    errors = 0
+    with Session() as session:
+        for _ in range(count):
+            start = perf_counter()
+            try:
+                response = session.get(url)
+                if response.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(perf_counter() - start)
+    return latencies, errors
+
+
+def main():
+    parser = ArgumentParser(description="Load test an endpoint of the website")
+    parser.add_argument("--url", default="http://localhost:8080/api/mcp?s=tick", help="The url to request")
+    parser.add_argument("--concurrency", type=int, default=8, help="The number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000, help="The total number of requests to make")
+    args = parser.parse_args()
+
+    per_worker = max(1, args.requests // args.concurrency)
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda _: worker(args.url, per_worker), range(args.concurrency)))
+    elapsed = perf_counter() - start
+
+    latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+    errors = sum(worker_errors for _, worker_errors in results)
+    print(f"Requests:   {len(latencies)} ({errors} errors) in {elapsed:.2f}s")
+    print(f"Throughput: {len(latencies) / elapsed:.1f} requests/s")
+    print(f"p50:        {percentile(latencies, 50) * 1000:.2f} ms")
+    print(f"p99:        {percentile(latencies, 99) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Synthetic mappings shared by the benchmarks
+"""
+
+from typing import List
+
+from bot.mappings.downloader import Class, Field, Method, Parameter, Side
+
+
+def build_classes(count: int, fields: int = 20, methods: int = 30, parameters: int = 3) -> List[Class]:
+    """
+    :param count: The number of classes to build
+    :param fields: The number of fields in each class
+    :param methods: The number of methods in each class
+    :param parameters: The number of parameters of each method
+    :return: The classes, each with a constructor as well
+    """
+    classes = []
+    for i in range(count):
+        clazz = Class(f"a{i}", f"net/minecraft/Class{i}", f"Class{i}", None)
+        for j in range(fields):
+            clazz.add_field(Field(f"f{j}", f"field_{i}_{j}_a", f"field{j}", "A field", Side.BOTH))
+        for j in range(methods):
+            method = Method(f"m{j}", f"func_{i}{j}_a", "(ILjava/lang/String;)V", f"method{j}", "A method",
+                            Side.CLIENT, False)
+            for k in range(parameters):
+                method.add_parameter(Parameter(None, f"p_{i}{j}_{k}_", f"param{k}", None, Side.BOTH))
+            clazz.add_method(method)
+        clazz.add_constructor(Method(None, str(i), "(I)V", "<init>", None, Side.BOTH, False))
+        classes.append(clazz)
+    return classes
@@ -0,0 +1,40 @@
+"""
+Compare the throughput of flask_restful's marshal against the precompiled API serializers
+
+Usage: python -m benchmarks.marshalling --classes 200
+"""
+
+from argparse import ArgumentParser
+from json import dumps
+from timeit import timeit
+
+from flask_restful import marshal
+
+from benchmarks.mappings import build_classes
+from website.views.api import class_fields, Serializer
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark marshalling of class results")
+    parser.add_argument("--classes", type=int, default=200, help="The number of classes to encode")
+    parser.add_argument("--repeat", type=int, default=5, help="The number of times to encode every class")
+    args = parser.parse_args()
+
+    classes = build_classes(args.classes)
+    total = args.classes * args.repeat
+
+    uncached = Serializer(class_fields, cache=False)
+    cached = Serializer(class_fields)
+    cached.encode_list(classes)
+
+    results = {
+        "marshal + json.dumps": timeit(lambda: dumps(marshal(classes, class_fields)), number=args.repeat),
+        "Serializer (cold)": timeit(lambda: uncached.encode_list(classes), number=args.repeat),
+        "Serializer (cached)": timeit(lambda: cached.encode_list(classes), number=args.repeat)
+    }
+    for name, elapsed in results.items():
+        print(f"{name:<22} {total / elapsed:>12.1f} classes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure how many messages a second the bot's message handler gets through, comparing the pre-filtered handler against
+processing commands and building a context for every message
+
+Usage: python -m benchmarks.message_throughput --messages 100000 --commands 0.02 --attachments 0.01
+"""
+
+from argparse import ArgumentParser
+from random import Random
+from time import perf_counter
+from types import SimpleNamespace
+
+from bot import bot
+from bot.autobin import on_message
+
+
+async def unfiltered(message):
+    await bot.process_commands(message)
+    if len(message.attachments) > 0:
+        await bot.get_context(message)
+
+
+def build_messages(count: int, commands: float, attachments: float, seed: int = 0):
+    random = Random(seed)
+    author = SimpleNamespace(id=1, bot=False, display_name="User")
+    messages = []
+    for i in range(count):
+        roll = random.random()
+        if roll < commands:
+            content, files = "!benchmark", []
+        elif roll < commands + attachments:
+            content, files = "Look at this", [SimpleNamespace(filename="screenshot.png", size=1024)]
+        else:
+            content, files = f"Just chatting about mod number {i}", []
+        messages.append(SimpleNamespace(id=i, content=content, attachments=files, author=author, guild=None,
+                                        channel=None, mentions=[], role_mentions=[], _state=None))
+    return messages
+
+
+async def handle_all(handler, messages) -> float:
+    start = perf_counter()
+    for message in messages:
+        await handler(message)
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the message handler")
+    parser.add_argument("--messages", type=int, default=100000, help="The number of synthetic messages")
+    parser.add_argument("--commands", type=float, default=0.02, help="The fraction of messages which are commands")
+    parser.add_argument("--attachments", type=float, default=0.01,
+                        help="The fraction of messages with (non text) attachments")
+    args = parser.parse_args()
+
+    @bot.command(name="benchmark")
+    async def benchmark(ctx):
+        pass
+
+    # The bot never logs in, so give it a user for process_commands to compare authors against
+    bot._connection.user = SimpleNamespace(id=0)
+    messages = build_messages(args.messages, args.commands, args.attachments)
+    for name, handler in (("unfiltered", unfiltered), ("pre-filtered", on_message)):
+        elapsed = bot.loop.run_until_complete(handle_all(handler, messages))
+        print(f"{name:<13} {elapsed:6.2f}s {args.messages / elapsed:>10.0f} messages/s")
+
+
+if __name__ == "__main__":
+    main()
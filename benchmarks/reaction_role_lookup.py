@@ -0,0 +1,83 @@
+"""
+Measure how long a reaction role lookup takes as the table grows, with and without the composite lookup index
+
+Usage: python benchmarks/reaction_role_lookup.py --sizes 1000 10000 100000 1000000
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Text, Boolean, Index, and_, select
+
+
+def create_table(metadata: MetaData, indexed: bool) -> Table:
+    table = Table("reaction_role", metadata,
+                  Column("ReactionRoleId", Integer, primary_key=True),
+                  Column("GuildId", Integer, nullable=False),
+                  Column("ChannelId", Integer, nullable=False),
+                  Column("MessageId", Integer, nullable=False),
+                  Column("EmojiName", Text, nullable=False),
+                  Column("EmojiAnimated", Boolean, nullable=False),
+                  Column("EmojiId", Integer, nullable=True),
+                  Column("RoleId", Integer, nullable=False),
+                  Column("ReactionRoleType", Integer, nullable=False))
+    if indexed:
+        Index("ix_reaction_role_lookup", table.c.MessageId, table.c.EmojiName, table.c.EmojiId)
+    return table
+
+
+def populate(engine, table: Table, size: int):
+    rows = []
+    with engine.begin() as connection:
+        for i in range(size):
+            rows.append({"GuildId": i % 50, "ChannelId": i % 500, "MessageId": 10 ** 17 + i,
+                         "EmojiName": f"emoji{i % 20}", "EmojiAnimated": False, "EmojiId": 10 ** 16 + i,
+                         "RoleId": i, "ReactionRoleType": 1})
+            if len(rows) == 10000:
+                connection.execute(table.insert(), rows)
+                rows = []
+        if len(rows) > 0:
+            connection.execute(table.insert(), rows)
+
+
+def measure(engine, table: Table, size: int, lookups: int, random: Random) -> float:
+    with engine.connect() as connection:
+        start = perf_counter()
+        for _ in range(lookups):
+            i = random.randrange(size)
+            query = select([table]).where(and_(
+                table.c.GuildId == i % 50, table.c.ChannelId == i % 500, table.c.MessageId == 10 ** 17 + i,
+                table.c.EmojiName == f"emoji{i % 20}", table.c.EmojiAnimated == False,
+                table.c.EmojiId == 10 ** 16 + i)).limit(1)
+            connection.execute(query).first()
+        return (perf_counter() - start) / lookups
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark reaction role lookups")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="The table sizes to test")
+    parser.add_argument("--lookups", type=int, default=200, help="The number of lookups per table size")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'no index':>14} {'indexed':>14}")
+    with TemporaryDirectory() as directory:
+        for size in args.sizes:
+            latencies = []
+            for indexed in (False, True):
+                path = Path(directory) / f"{size}-{indexed}.db"
+                engine = create_engine(f"sqlite:///{path}")
+                metadata = MetaData()
+                table = create_table(metadata, indexed)
+                metadata.create_all(engine)
+                populate(engine, table, size)
+                latencies.append(measure(engine, table, size, args.lookups, Random(0)))
+                engine.dispose()
+            print(f"{size:>10} {latencies[0] * 1000:>11.3f} ms {latencies[1] * 1000:>11.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare concurrent reads and writes against SQLite with the default settings and the tuned storage profile
+
+Usage: python -m benchmarks.sqlite_profile --readers 4 --writers 1 --seconds 5
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from random import Random
+from tempfile import TemporaryDirectory
+from threading import Thread, Event
+from time import sleep
+
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Text, select
+from sqlalchemy.pool import QueuePool
+
+import config
+from utils.database import apply_sqlite_pragmas
+
+
+ROWS = 10000
+
+
+def create(path: Path, tuned: bool, connections: int):
+    if tuned:
+        engine = create_engine(f"sqlite:///{path}", poolclass=QueuePool, pool_size=connections, max_overflow=2,
+                               connect_args={"check_same_thread": False})
+        apply_sqlite_pragmas(engine, config.SQLITE_PRAGMAS)
+    else:
+        engine = create_engine(f"sqlite:///{path}")
+    metadata = MetaData()
+    table = Table("user_options", metadata,
+                  Column("UserId", Integer, primary_key=True),
+                  Column("DefaultMCPMinecraftVersion", Text))
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{"UserId": i, "DefaultMCPMinecraftVersion": "latest"}
+                                            for i in range(ROWS)])
+    return engine, table
+
+
+def reader(engine, table, stop: Event, counts: dict, seed: int):
+    random = Random(seed)
+    while not stop.is_set():
+        try:
+            with engine.connect() as connection:
+                connection.execute(select([table]).where(table.c.UserId == random.randrange(ROWS))).first()
+            counts["reads"] += 1
+        except Exception:
+            counts["errors"] += 1
+
+
+def writer(engine, table, stop: Event, counts: dict, seed: int):
+    random = Random(seed)
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(table.update().where(table.c.UserId == random.randrange(ROWS))
+                                   .values(DefaultMCPMinecraftVersion=str(random.random())))
+            counts["writes"] += 1
+        except Exception:
+            counts["errors"] += 1
+
+
+def run(path: Path, tuned: bool, readers: int, writers: int, seconds: float) -> dict:
+    engine, table = create(path, tuned, readers + writers)
+    stop = Event()
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    threads = [Thread(target=reader, args=(engine, table, stop, counts, i)) for i in range(readers)]
+    threads += [Thread(target=writer, args=(engine, table, stop, counts, readers + i)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return counts
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the SQLite storage profiles")
+    parser.add_argument("--readers", type=int, default=4, help="The number of reading threads")
+    parser.add_argument("--writers", type=int, default=1, help="The number of writing threads")
+    parser.add_argument("--seconds", type=float, default=5, help="How long to run each profile for")
+    args = parser.parse_args()
+
+    with TemporaryDirectory() as directory:
+        for tuned in (False, True):
+            counts = run(Path(directory) / f"{tuned}.db", tuned, args.readers, args.writers, args.seconds)
+            print(f"{'tuned' if tuned else 'default':<8} {counts['reads'] / args.seconds:>10.0f} reads/s "
+                  f"{counts['writes'] / args.seconds:>8.0f} writes/s {counts['errors']:>6} errors")
+
+
+if __name__ == "__main__":
+    main()
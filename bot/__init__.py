@@ -2,16 +2,122 @@ from discord.ext import commands
 from discord import DMChannel, Game, Embed, Status, Activity
 from discord.ext.commands import CommandNotFound, CheckFailure, CommandInvokeError, MissingRequiredArgument
 
-from models import ServerOptions, UserOptions
-from main import db
+from models import ServerOptions
 from sync import schedule_functions
+from .database import options_writer, server_options_cache, user_options_cache
+from utils.metrics import counter, timer, current_breakdown, add_to_breakdown
+from utils.scheduler import scheduler
+from contextvars import ContextVar
+from functools import wraps
+from logging import getLogger
+from time import perf_counter
+from typing import Awaitable, Callable, List, Optional, Tuple
 import os
-import aioschedule as schedule
 
-bot = commands.Bot(command_prefix="!")
+logger = getLogger("bot")
+
+
+class Bot(commands.Bot):
+    """
+    The bot, which also runs the shutdown hooks registered by its modules once it has disconnected
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.__shutdown_hooks: List[Callable[[], Awaitable]] = []
+
+    def on_shutdown(self, hook: Callable[[], Awaitable]) -> Callable[[], Awaitable]:
+        """
+        Register a coroutine function to run when the bot closes, while the event loop is still running. Can be used as
+        a decorator
+
+        :param hook: The coroutine function
+        :return: The coroutine function
+        """
+        self.__shutdown_hooks.append(hook)
+        return hook
+
+    async def close(self):
+        await super().close()
+        # Taken so that the hooks only run once if the bot is closed again
+        hooks, self.__shutdown_hooks = self.__shutdown_hooks, []
+        for hook in hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Shutdown hook {hook.__qualname__} failed")
+                logger.exception(e)
+
+
+bot = Bot(command_prefix="!")
 bot.remove_command("help")
 
 
+COMMANDS = counter("commands_total", "How many bot commands have run", ("command", "status"))
+COMMAND_ERRORS = counter("command_errors_total", "How many bot commands have failed", ("command", "error"))
+# Includes the time paged results wait for the user to turn the page
+COMMAND_TIME = timer("command_duration_seconds", "How long bot commands take to finish", ("command",))
+COMMAND_RESPONSE_TIME = timer("command_response_seconds", "How long bot commands take to send their first message",
+                              ("command",))
+COMMAND_BREAKDOWN_TIME = timer("command_breakdown_seconds",
+                               "How long bot commands spend on the database, searching and Discord API calls",
+                               ("command", "category"))
+DISCORD_REQUEST_TIME = timer("discord_request_duration_seconds", "How long calls to the Discord API take",
+                             ("method", "route"))
+BREAKDOWN_CATEGORIES = ("database", "search", "discord")
+SEND_MESSAGE_ROUTE = "/channels/{channel_id}/messages"
+
+# The command being run and when it started, until it sends its first message
+awaiting_response: ContextVar[Optional[Tuple[str, float]]] = ContextVar("awaiting_response", default=None)
+
+
+def time_discord_requests(http):
+    """
+    Record how long every call the bot makes to the Discord API takes, and when each command first replies
+    """
+    request = http.request
+
+    @wraps(request)
+    async def timed_request(route, **kwargs):
+        start = perf_counter()
+        try:
+            return await request(route, **kwargs)
+        finally:
+            end = perf_counter()
+            # Label by the route's template so every channel does not create a new series
+            DISCORD_REQUEST_TIME.observe(end - start, method=route.method, route=route.path)
+            add_to_breakdown("discord", end - start)
+            pending = awaiting_response.get()
+            if pending is not None and route.method == "POST" and route.path == SEND_MESSAGE_ROUTE:
+                COMMAND_RESPONSE_TIME.observe(end - pending[1], command=pending[0])
+                awaiting_response.set(None)
+
+    http.request = timed_request
+
+
+time_discord_requests(bot.http)
+
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    # Hooks run in the command's own task, so these only apply to this command
+    ctx.started = perf_counter()
+    ctx.breakdown = {}
+    current_breakdown.set(ctx.breakdown)
+    awaiting_response.set((ctx.command.qualified_name, ctx.started))
+
+
+@bot.after_invoke
+async def record_command_time(ctx):
+    name = ctx.command.qualified_name
+    COMMAND_TIME.observe(perf_counter() - ctx.started, command=name)
+    for category in BREAKDOWN_CATEGORIES:
+        COMMAND_BREAKDOWN_TIME.observe(ctx.breakdown.get(category, 0), command=name, category=category)
+    COMMANDS.inc(command=name, status="failed" if ctx.command_failed else "success")
+    current_breakdown.set(None)
+    awaiting_response.set(None)
+
+
 CJ_USER_ID = 232575009200013313
 
 
@@ -19,37 +125,36 @@ def is_dm(ctx):
     return isinstance(ctx.message.channel, DMChannel)
 
 
-def get_server_options(guild_id):
-    server_options = ServerOptions.query.filter(ServerOptions.GuildId == guild_id).first()
-    if server_options is None:
-        server_options = ServerOptions(GuildId=guild_id)
-        db.session.add(server_options)
-        db.session.commit()
-    return server_options
+async def get_server_options(guild_id):
+    return await server_options_cache.get(guild_id)
 
 
-def get_server_options_from_context(ctx):
+async def get_server_options_from_context(ctx):
     if is_dm(ctx):
         return ServerOptions(GuildId=None)
-    return get_server_options(ctx.message.channel.guild.id)
+    return await get_server_options(ctx.message.channel.guild.id)
 
 
-def get_user_options(user_id):
-    user_options = UserOptions.query.filter(UserOptions.UserId == user_id).first()
-    if user_options is None:
-        user_options = UserOptions(UserId=user_id)
-        db.session.add(user_options)
-        db.session.commit()
-    return user_options
+async def get_user_options(user_id):
+    return await user_options_cache.get(user_id)
 
 
-def get_user_options_from_context(ctx):
-    return get_user_options(ctx.message.author.id)
+async def get_user_options_from_context(ctx):
+    return await get_user_options(ctx.message.author.id)
+
+
+def save_options(options):
+    if isinstance(options, ServerOptions):
+        server_options_cache.put(options.GuildId, options)
+    else:
+        user_options_cache.put(options.UserId, options)
+    # Written to the database in the next batch
+    options_writer.queue(options)
 
 
 def has_admin_role():
     async def predicate(ctx):
-        server_options = get_server_options_from_context(ctx)
+        server_options = await get_server_options_from_context(ctx)
         if server_options.AdminRoleId is not None:
             for role in ctx.author.roles:
                 if role.id == server_options.AdminRoleId:
@@ -60,6 +165,14 @@ def has_admin_role():
     return commands.check(predicate)
 
 
+def is_bot_owner():
+    # For commands which affect or expose the whole process rather than one server
+    async def predicate(ctx):
+        return ctx.author.id == CJ_USER_ID or await bot.is_owner(ctx.author)
+
+    return commands.check(predicate)
+
+
 def not_dm():
     async def predicate(ctx):
         return not is_dm(ctx)
@@ -104,6 +217,17 @@ class InvalidVersion(Exception):
         return self.__mc
 
 
+class MappingsLoading(Exception):
+
+    def __init__(self, version: str) -> None:
+        super().__init__("Mappings are still loading!")
+        self.__version = version
+
+    @property
+    def version(self):
+        return self.__version
+
+
 async def check_command(ctx, cmd):
     if len(cmd.checks) > 0:
         for check in cmd.checks:
@@ -120,10 +244,17 @@ async def send_error_for_failed_check(ctx, name: str):
     elif 'has_admin_role' == name:
         await send_error(ctx, "Invalid Permissions",
                          f"Cannot perform command `{ctx.message.content}` without admin privileges")
+    elif 'is_bot_owner' == name:
+        await send_error(ctx, "Invalid Permissions",
+                         f"Only the owner of the bot can perform command `{ctx.message.content}`")
 
 
 @bot.event
 async def on_command_error(ctx, error):
+    if not isinstance(error, CommandNotFound):
+        error_type = error.original if isinstance(error, CommandInvokeError) else error
+        COMMAND_ERRORS.inc(command=ctx.command.qualified_name if ctx.command is not None else "unknown",
+                           error=type(error_type).__name__)
     if isinstance(error, CheckFailure):
         name = await check_command(ctx, ctx.command)
         await send_error_for_failed_check(ctx, name)
@@ -134,23 +265,24 @@ async def on_command_error(ctx, error):
     elif isinstance(error, CommandInvokeError):
         if isinstance(error.original, InvalidVersion):
             await send_error(ctx, "Version Error", f"Please provide a vaild {'Minecraft' if error.original.mc else 'Forge'} version. To see all available versions type `{bot.command_prefix}{'mc' if error.original.mc else 'forge'}versions {error.original.version}`")
+        elif isinstance(error.original, MappingsLoading):
+            await send_error(ctx, "Mappings Loading", f"The mappings for {error.original.version} are still loading. Please try again in a minute")
         else:
-            print(error)
+            logger.error(f"Command {ctx.command.qualified_name} failed")
+            logger.exception(error.original, exc_info=error.original)
     else:
-        print(error)
+        logger.error(f"Command {ctx.message.content} failed: {error}")
         await send_error(ctx, "Error", "An error occurred")
 
 
 async def background_task():
-    from asyncio import sleep
     await bot.wait_until_ready()
-    await schedule_functions()
-    while True:
-        await schedule.run_pending()
-        await sleep(0.1)
+    schedule_functions()
+    await scheduler.run()
 
 
 bot.loop.create_task(background_task())
+bot.loop.create_task(options_writer.run())
 
 
 from . import reactionroles
@@ -159,8 +291,13 @@ from . import mappings
 from . import forge
 from . import help
 from . import autobin
+from . import admin
 
 
 def run():
     token = os.environ.get("DISCORD_BOT_SECRET")
-    bot.run(token)
+    try:
+        bot.run(token)
+    finally:
+        # Write any queued option changes even if the bot stopped with an error
+        options_writer.flush_sync()
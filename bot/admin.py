@@ -0,0 +1,134 @@
+from . import bot, is_bot_owner, send_message, send_error, COMMANDS, COMMAND_RESPONSE_TIME, \
+    COMMAND_BREAKDOWN_TIME, BREAKDOWN_CATEGORIES
+from .reactionroles import role_queue
+from main import app
+from datetime import datetime
+from discord import Embed, Colour
+from pathlib import Path
+from sync import sync_history
+from utils.profiler import profiler
+from utils.scheduler import scheduler
+
+
+def format_time(timestamp: float) -> str:
+    return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M UTC")
+
+
+def format_run(run: dict) -> str:
+    text = f"**{run['status']}**"
+    if run["duration"] is not None:
+        text += f" in {run['duration']:.1f}s"
+    if len(run["stages"]) > 0:
+        text += "\n" + ", ".join(f"{stage} {duration:.1f}s" for stage, duration in run["stages"].items())
+    text += f"\n{run['bytes'] / (1024 * 1024):.1f} MB downloaded, {run['objects']} objects built"
+    if run["error"] is not None:
+        text += f"\n`{run['error'][:200]}`"
+    return text
+
+
+@bot.command(name="syncstatus", short_doc="Shows when the sync functions run and how their last runs went")
+async def sync_status(ctx, count: int = 5):
+    """
+    Shows when the sync functions run and how their last runs went
+
+    :param ctx: The context for the command
+    :param count: Optional number of runs to show (default - 5)
+    :return: None
+    """
+    count = min(max(count, 1), 10)
+    embed = Embed(title="Sync Status", colour=Colour.gold())
+    for job in scheduler.jobs:
+        next_run = "running now" if job.running else format_time(job.next_run)
+        last_duration = "never run" if job.last_duration is None else f"{job.last_duration:.1f}s"
+        embed.add_field(name=f"Job {job.name}", value=f"Next run: {next_run}\nLast duration: {last_duration}",
+                        inline=False)
+    for run in reversed(sync_history.runs[-count:]):
+        embed.add_field(name=f"{run['name']} at {format_time(run['started'])}", value=format_run(run), inline=False)
+    embed.set_footer(text="Made by CJMinecraft")
+    await ctx.send(embed=embed)
+
+
+def format_seconds(seconds) -> str:
+    if seconds is None:
+        return "n/a"
+    if seconds == float("inf"):
+        return "slow"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+
+def count_runs(command: str) -> int:
+    return int(COMMANDS.value(command=command, status="success") + COMMANDS.value(command=command, status="failed"))
+
+
+def format_command_stats(command: str) -> str:
+    text = f"{count_runs(command)} runs, {int(COMMANDS.value(command=command, status='failed'))} failed"
+    responses = COMMAND_RESPONSE_TIME.count(command=command)
+    if responses > 0:
+        text += f"\nFirst reply: mean {format_seconds(COMMAND_RESPONSE_TIME.sum(command=command) / responses)}, " \
+                f"p50 {format_seconds(COMMAND_RESPONSE_TIME.quantile(0.5, command=command))}, " \
+                f"p95 {format_seconds(COMMAND_RESPONSE_TIME.quantile(0.95, command=command))}"
+    means = []
+    for category in BREAKDOWN_CATEGORIES:
+        count = COMMAND_BREAKDOWN_TIME.count(command=command, category=category)
+        if count > 0:
+            mean = COMMAND_BREAKDOWN_TIME.sum(command=command, category=category) / count
+            means.append(f"{category} {format_seconds(mean)}")
+    if len(means) > 0:
+        text += "\nMean time in " + ", ".join(means)
+    return text
+
+
+@bot.command(name="stats", short_doc="Shows how many times each command has run and how long they take")
+@is_bot_owner()
+async def stats(ctx):
+    """
+    Shows how many times each command has run since the bot started and how long they take
+
+    :param ctx: The context for the command
+    :return: None
+    """
+    commands = sorted({series["command"] for series in COMMANDS.series()}, key=count_runs, reverse=True)
+    embed = Embed(title="Command Stats", colour=Colour.gold())
+    if len(commands) == 0:
+        embed.description = "No commands have run yet"
+    embed.add_field(name="Role queue", value=f"{role_queue.depth} members waiting, last change applied after "
+                                             f"{format_seconds(role_queue.lag)}", inline=False)
+    # Embeds are limited to 25 fields
+    for command in commands[:24]:
+        embed.add_field(name=f"{bot.command_prefix}{command}", value=format_command_stats(command), inline=False)
+    embed.set_footer(text="Made by CJMinecraft")
+    await ctx.send(embed=embed)
+
+
+@bot.command(name="profile", short_doc="Starts or stops the sampling profiler")
+@is_bot_owner()
+async def profile(ctx, action: str = "status", duration: float = 60):
+    """
+    Starts or stops the sampling profiler, which writes the stacks of the bot and the website to a file on the server
+
+    :param ctx: The context for the command
+    :param action: Either start, stop or status (default - status)
+    :param duration: Optional number of seconds to profile for unless stopped earlier (default - 60)
+    :return: None
+    """
+    action = action.lower()
+    if action == "start":
+        duration = min(max(duration, 1), app.config["PROFILE_MAX_SECONDS"])
+        output = profiler.start(Path(app.config["PROFILE_DIR"]), duration, app.config["PROFILE_INTERVAL"])
+        if output is None:
+            await send_error(ctx, "Profiler", f"A profile is already running for another {profiler.remaining:.0f}s")
+        else:
+            await send_message(ctx, "Profiler", f"Profiling for {duration:.0f}s into `{output.name}`")
+    elif action == "stop":
+        # Stopping waits for the stacks to be written, which should not block the event loop
+        output = await bot.loop.run_in_executor(None, profiler.stop)
+        if output is None:
+            await send_error(ctx, "Profiler", "No profile is running")
+        else:
+            await send_message(ctx, "Profiler", f"Wrote the profile to `{output.name}`")
+    elif profiler.running:
+        await send_message(ctx, "Profiler", f"Profiling into `{profiler.output.name}` for another "
+                                            f"{profiler.remaining:.0f}s")
+    else:
+        last = "" if profiler.output is None else f". The last profile was written to `{profiler.output.name}`"
+        await send_message(ctx, "Profiler", f"No profile is running{last}")
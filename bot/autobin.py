@@ -1,12 +1,45 @@
 from . import bot
-from pbwrap import Pastebin
+from main import app
+from abc import ABCMeta, abstractmethod
+from asyncio import Lock, Queue, QueueFull
+from aiohttp import ClientSession
 from os import getenv
 from mimetypes import guess_type
-from requests import get
 from discord import Embed
+from logging import getLogger
+from hashlib import sha256
+from json import loads, dumps
+from pathlib import Path
+from re import compile
+from time import time
+from typing import Dict, Optional
+from utils import MASTER_PATH, atomic_write
+from utils.paste import PasteStore
+from utils.metrics import timed
+from utils.scheduler import scheduler
+
+
+logger = getLogger("autobin")
 
 
 PASTEBIN_DEV_KEY = getenv("PASTEBIN_DEV_KEY")
+PASTEBIN_API_URL = "https://pastebin.com/api/api_post.php"
+
+# The number of uploads which run at once and how many messages can wait for an upload
+UPLOAD_WORKERS = int(getenv("AUTOBIN_WORKERS", 4))
+UPLOAD_QUEUE_SIZE = int(getenv("AUTOBIN_QUEUE_SIZE", 100))
+
+# Attachments up to AUTOBIN_MAX_SIZE bytes are pasted whole. Larger ones are cut down to their head, the region around
+# the first stack trace and their tail, and ones over AUTOBIN_DOWNLOAD_LIMIT bytes are not downloaded at all
+MAX_PASTE_SIZE = int(getenv("AUTOBIN_MAX_SIZE", 512 * 1024))
+HEAD_SIZE = int(getenv("AUTOBIN_HEAD_SIZE", 128 * 1024))
+TAIL_SIZE = int(getenv("AUTOBIN_TAIL_SIZE", 256 * 1024))
+TRACE_CONTEXT = int(getenv("AUTOBIN_TRACE_CONTEXT", 32 * 1024))
+DOWNLOAD_LIMIT = int(getenv("AUTOBIN_DOWNLOAD_LIMIT", 64 * 1024 * 1024))
+CHUNK_SIZE = 64 * 1024
+
+PASTE_CACHE_FILE = MASTER_PATH / "database" / "pastes.json"
+PASTE_CACHE_SIZE = 5000
 
 
 def get_file_type_from_name(name: str) -> str:
@@ -20,22 +53,348 @@ def is_valid_file(name: str) -> bool:
     return name.lower() in VALID_FILE_TYPES
 
 
-api = Pastebin(PASTEBIN_DEV_KEY)
+def is_text_attachment(attachment) -> bool:
+    mime = guess_type(attachment.filename)[0]
+    return (mime is not None and mime.startswith("text")) or is_valid_file(get_file_type_from_name(attachment.filename))
+
+
+__session: Optional[ClientSession] = None
+
+
+def get_session() -> ClientSession:
+    """
+    :return: The session shared by every download and upload, created on first use
+    """
+    global __session
+    if __session is None:
+        __session = ClientSession()
+    return __session
+
+
+@bot.on_shutdown
+async def close_session():
+    global __session
+    if __session is not None:
+        await __session.close()
+        __session = None
+
+
+# The first frame of a Java stack trace. Only horizontal whitespace is allowed before "at", as \s would also match
+# newlines and make the search quadratic on runs of blank lines
+STACK_TRACE = compile(rb"\n[ \t]*at [\w$.<>]+\(")
+
+
+class Excerpt:
+    """
+    Reads an attachment a chunk at a time while only holding a bounded amount of it in memory. Content up to the limit
+    is kept whole, otherwise only the head, the region around the first stack trace and the tail are kept
+    """
+
+    def __init__(self, limit: int, head: int, tail: int, context: int) -> None:
+        self.__limit = limit
+        self.__head_size = head
+        self.__tail_size = tail
+        self.__context = context
+        self.__size = 0
+        self.__digest = sha256()
+        self.__head = bytearray()
+        self.__trace: Optional[bytearray] = None
+        self.__trace_start = 0
+        # The most recent bytes, for the tail and the context before a stack trace
+        self.__recent = bytearray()
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def truncated(self) -> bool:
+        return self.__size > self.__limit
+
+    @property
+    def digest(self) -> str:
+        """
+        :return: The SHA-256 of all of the content read, not just the excerpt
+        """
+        return self.__digest.hexdigest()
+
+    def feed(self, chunk: bytes):
+        offset = self.__size
+        self.__size += len(chunk)
+        self.__digest.update(chunk)
+        if offset < self.__limit:
+            self.__head += chunk[:self.__limit - offset]
+
+        if self.__trace is None:
+            # Include the end of the previous chunk in case the start of the trace was split between them
+            overlap = self.__recent[-64:]
+            match = STACK_TRACE.search(overlap + chunk)
+            if match is not None:
+                recent_start = offset - len(self.__recent)
+                self.__trace_start = max(offset - len(overlap) + match.start() - self.__context, recent_start)
+                self.__trace = (self.__recent + chunk)[self.__trace_start - recent_start:]
+                del self.__trace[2 * self.__context:]
+        elif len(self.__trace) < 2 * self.__context:
+            self.__trace += chunk[:2 * self.__context - len(self.__trace)]
+
+        self.__recent += chunk
+        del self.__recent[:-max(self.__tail_size, self.__context)]
+
+    def read(self) -> bytes:
+        """
+        :return: The content, or the excerpt of it if it was over the limit
+        """
+        if not self.truncated:
+            return bytes(self.__head)
+        tail = self.__recent[-self.__tail_size:]
+        parts = [(0, self.__head[:self.__head_size])]
+        if self.__trace is not None:
+            parts.append((self.__trace_start, self.__trace))
+        parts.append((self.__size - len(tail), tail))
+        # The trace may start inside the tail, in which case merging in this order would skip part of the tail
+        parts.sort(key=lambda part: part[0])
+
+        excerpt = bytearray()
+        end = 0
+        for start, part in parts:
+            if start > end:
+                excerpt += f"\n\n[... {start - end} bytes skipped ...]\n\n".encode("utf-8")
+            if start + len(part) > end:
+                excerpt += part[max(end - start, 0):]
+                end = start + len(part)
+        return bytes(excerpt)
+
+
+@timed
+async def read_attachment(attachment) -> Optional[Excerpt]:
+    """
+    Stream the given attachment from Discord
+
+    :param attachment: The attachment to read
+    :return: The excerpt of the attachment or None if it is too large to download
+    """
+    if attachment.size > DOWNLOAD_LIMIT:
+        logger.warning(f"Skipped {attachment.filename} as it is {attachment.size} bytes")
+        return None
+    excerpt = Excerpt(MAX_PASTE_SIZE, HEAD_SIZE, TAIL_SIZE, TRACE_CONTEXT)
+    async with get_session().get(attachment.url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            excerpt.feed(chunk)
+            if excerpt.size >= DOWNLOAD_LIMIT:
+                break
+    return excerpt
+
+
+class PasteError(Exception):
+    pass
+
+
+class PasteBackend(metaclass=ABCMeta):
+    """
+    Somewhere that the contents of an attachment can be uploaded to
+    """
+
+    # How long, in seconds, a paste lasts before it expires (None for never)
+    expiry: Optional[float] = None
+
+    @abstractmethod
+    async def create_paste(self, content: bytes, name: str) -> str:
+        """
+        Upload the given content
+
+        :param content: The content of the attachment
+        :param name: The file name of the attachment
+        :return: The url of the paste
+        """
+        pass
+
+
+class PastebinBackend(PasteBackend):
+    """
+    Uploads pastes to Pastebin, reusing one pool of connections for every upload
+    """
+
+    expiry = 30 * 24 * 60 * 60
+
+    def __init__(self, dev_key: str) -> None:
+        self.__dev_key = dev_key
+
+    @timed
+    async def create_paste(self, content: bytes, name: str) -> str:
+        data = {
+            "api_dev_key": self.__dev_key,
+            "api_option": "paste",
+            "api_paste_code": content.decode("utf-8", errors="replace"),
+            "api_paste_name": name,
+            "api_paste_private": 1,
+            "api_paste_expire_date": "1M"
+        }
+        async with get_session().post(PASTEBIN_API_URL, data=data) as response:
+            text = await response.text()
+            if response.status != 200 or not text.startswith("http"):
+                raise PasteError(f"Failed to create paste {name}: {text}")
+            return text
+
+
+class LocalPasteBackend(PasteBackend):
+    """
+    Stores pastes on disk to be served by the website, so uploading is only a local write
+    """
+
+    def __init__(self, store: PasteStore, base_url: str, expiry_days: int) -> None:
+        self.__store = store
+        self.__base_url = base_url.rstrip("/")
+        self.expiry = expiry_days * 24 * 60 * 60
+
+    @property
+    def store(self) -> PasteStore:
+        return self.__store
+
+    @timed
+    async def create_paste(self, content: bytes, name: str) -> str:
+        key = await bot.loop.run_in_executor(None, self.__store.put, content, name, self.expiry)
+        return f"{self.__base_url}/paste/{key}"
+
+
+if app.config["PASTE_BACKEND"] == "local":
+    paste_backend: PasteBackend = LocalPasteBackend(PasteStore(Path(app.config["PASTE_STORE"])),
+                                                    app.config["PASTE_BASE_URL"], app.config["PASTE_EXPIRY_DAYS"])
+else:
+    paste_backend: PasteBackend = PastebinBackend(PASTEBIN_DEV_KEY)
+
+
+def set_paste_backend(backend: PasteBackend):
+    global paste_backend
+    paste_backend = backend
+
+
+class PasteCache:
+    """
+    Remembers the paste created for the contents of each attachment, so that a file which is posted again is answered
+    with the existing paste rather than uploaded again. The cache is stored on disk so it lasts between restarts
+    """
+
+    # Pastes which will expire within this many seconds are not reused
+    EXPIRY_MARGIN = 60 * 60
+
+    def __init__(self, path: Path, size: int) -> None:
+        self.__path = path
+        self.__size = size
+        self.__pastes: Dict[str, dict] = {}
+        # Saves are written one at a time so that an older copy never replaces a newer one
+        self.__save_lock = Lock()
+        if path.exists():
+            try:
+                self.__pastes = loads(path.read_text())
+            except ValueError:
+                logger.warning(f"Ignoring corrupt paste cache {path}")
+        self.__prune()
+
+    def __prune(self):
+        now = time()
+        self.__pastes = {digest: paste for digest, paste in self.__pastes.items()
+                         if paste["expires"] is None or paste["expires"] - self.EXPIRY_MARGIN > now}
+        if len(self.__pastes) > self.__size:
+            # Keep the pastes which will last the longest
+            pastes = sorted(self.__pastes.items(), key=lambda item: item[1]["expires"] or float("inf"), reverse=True)
+            self.__pastes = dict(pastes[:self.__size])
+
+    def get(self, digest: str) -> Optional[str]:
+        paste = self.__pastes.get(digest)
+        if paste is None:
+            return None
+        if paste["expires"] is not None and paste["expires"] - self.EXPIRY_MARGIN <= time():
+            del self.__pastes[digest]
+            return None
+        return paste["url"]
+
+    async def put(self, digest: str, url: str, expiry: Optional[float]):
+        self.__pastes[digest] = {"url": url, "expires": time() + expiry if expiry is not None else None}
+        self.__prune()
+        await self.save()
+
+    async def save(self):
+        async with self.__save_lock:
+            # Written from a copy in an executor, so neither the disk nor later changes hold up the event loop
+            await bot.loop.run_in_executor(None, self.__write, self.__path, dict(self.__pastes))
+
+    @staticmethod
+    def __write(path: Path, pastes: Dict[str, dict]):
+        with atomic_write(path) as f:
+            f.write(dumps(pastes, separators=(',', ':')))
+
+
+paste_cache = PasteCache(PASTE_CACHE_FILE, PASTE_CACHE_SIZE)
+
+
+async def create_paste(excerpt: Excerpt, name: str) -> str:
+    """
+    Get the paste for the given attachment, only uploading it if it has not been uploaded already
+
+    :param excerpt: The content of the attachment
+    :param name: The file name of the attachment
+    :return: The url of the paste
+    """
+    digest = excerpt.digest
+    url = paste_cache.get(digest)
+    if url is None:
+        url = await paste_backend.create_paste(excerpt.read(), name)
+        await paste_cache.put(digest, url, paste_backend.expiry)
+    return url
+
+
+upload_queue = Queue(maxsize=UPLOAD_QUEUE_SIZE)
+
+
+async def upload(message):
+    urls = ""
+    for attachment in message.attachments:
+        if is_text_attachment(attachment):
+            excerpt = await read_attachment(attachment)
+            if excerpt is not None:
+                urls += await create_paste(excerpt, attachment.filename) + " "
+    if len(urls) > 0:
+        await message.delete()
+        embed = Embed(description=f"{message.content} {urls}")
+        embed.set_author(name=message.author.display_name, icon_url=message.author.avatar_url)
+        embed.set_footer(text="Made by CJMinecraft")
+        await message.channel.send(embed=embed)
+
+
+async def upload_worker():
+    while True:
+        message = await upload_queue.get()
+        try:
+            await upload(message)
+        except Exception as e:
+            logger.error(f"Failed to upload the attachments of message {message.id}")
+            logger.exception(e)
+        finally:
+            upload_queue.task_done()
+
+
+async def expire_pastes():
+    if isinstance(paste_backend, LocalPasteBackend):
+        removed = await bot.loop.run_in_executor(None, paste_backend.store.expire)
+        if removed > 0:
+            logger.info(f"Deleted {removed} expired pastes")
+
+
+scheduler.every(60 * 60, expire_pastes)
+
+
+for _ in range(UPLOAD_WORKERS):
+    bot.loop.create_task(upload_worker())
 
 
 @bot.event
 async def on_message(message):
-    await bot.process_commands(message)
-    ctx = await bot.get_context(message)
-    if len(message.attachments) > 0:
-        urls = ""
-        for attachment in message.attachments:
-            if "text" in guess_type(attachment.filename)[0] or is_valid_file(get_file_type_from_name(attachment.filename)):
-                url = api.create_paste(api_paste_code=get(attachment.url).content, api_paste_name=attachment.filename, api_paste_private=1, api_paste_expire_date="1M")
-                urls += url + " "
-        if len(urls) > 0:
-            await message.delete()
-            embed = Embed(description=f"{message.content} {urls}")
-            embed.set_author(name=message.author.display_name, icon_url=message.author.avatar_url)
-            embed.set_footer(text="Made by CJMinecraft")
-            await ctx.send(embed=embed)
+    # Most messages are neither commands nor have attachments, so check for both before doing any other work
+    if message.content.startswith(bot.command_prefix):
+        await bot.process_commands(message)
+    if message.attachments and any(map(is_text_attachment, message.attachments)):
+        try:
+            upload_queue.put_nowait(message)
+        except QueueFull:
+            logger.warning(f"Skipped uploading the attachments of message {message.id} as the upload queue is full")
@@ -0,0 +1,37 @@
+"""
+The bot's access to the database. All queries run through an AsyncDatabase so that they never block the event loop
+and use their own sessions rather than the website's
+"""
+
+from main import app, db
+from models import ServerOptions, UserOptions
+from utils.database import AsyncDatabase, ReadThroughCache, WriteBehindBuffer
+
+
+database = AsyncDatabase(db.engine, app.config["BOT_DATABASE_WORKERS"])
+
+
+def fetch_server_options(session, guild_id: int) -> ServerOptions:
+    server_options = session.query(ServerOptions).get(guild_id)
+    if server_options is None:
+        # Only stored once a setting is changed
+        server_options = ServerOptions(GuildId=guild_id)
+    return server_options
+
+
+def fetch_user_options(session, user_id: int) -> UserOptions:
+    user_options = session.query(UserOptions).get(user_id)
+    if user_options is None:
+        # Only stored once a setting is changed
+        user_options = UserOptions(UserId=user_id, DefaultMCPMinecraftVersion="latest")
+    return user_options
+
+
+options_writer = WriteBehindBuffer(database, app.config["OPTIONS_WRITE_INTERVAL"])
+server_options_cache = ReadThroughCache(database, fetch_server_options, app.config["OPTIONS_CACHE_SIZE"])
+user_options_cache = ReadThroughCache(database, fetch_user_options, app.config["OPTIONS_CACHE_SIZE"])
+
+
+def add(session, instance):
+    session.add(instance)
+    return instance
@@ -1,7 +1,8 @@
 from typing import Optional
-from bot import bot, get_user_options_from_context, InvalidVersion
+from bot import bot, get_user_options_from_context, InvalidVersion, MappingsLoading
 from discord import Embed
-from .downloader import MCPDownloader
+from itertools import chain
+from .downloader import MCPDownloader, MappingDatabase
 from bot.page import Page
 
 
@@ -38,7 +39,7 @@ async def latest_mcp(ctx, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
     version = resolve_version(version)
     if version is None:
         raise InvalidVersion("", True)
@@ -63,15 +64,17 @@ async def not_found(ctx):
     await ctx.send(embed=embed)
 
 
-def search_all(name: str, version: str):
-    for result in MCPDownloader.database[version].search_field(name):
-        yield result
-    for result in MCPDownloader.database[version].search_method(name):
-        yield result
-    for result in MCPDownloader.database[version].search_parameters(name):
-        yield result
-    for result in MCPDownloader.database[version].search_classes(name):
-        yield result
+def get_database(version: str) -> MappingDatabase:
+    database = MCPDownloader.database.get(version)
+    if database is None:
+        # The version is known but its database has not been loaded or built yet
+        raise MappingsLoading(version)
+    return database
+
+
+def search_all(name: str, database: MappingDatabase):
+    return chain(database.search_field(name), database.search_method(name), database.search_parameters(name),
+                 database.search_classes(name))
 
 
 @bot.command(name="mcp", short_doc="Looks up a field, method or parameter within an MCP version")
@@ -85,7 +88,7 @@ async def mappings(ctx, name: str, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
 
     if name.startswith("field"):
         await find_field(ctx, name, version)
@@ -98,7 +101,7 @@ async def mappings(ctx, name: str, version: Optional[str] = None):
         if version is None:
             raise InvalidVersion("", True)
 
-        page = Page(5, search_all(name, version))
+        page = Page(5, search_all(name, get_database(version)))
         await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
 
         # found_field = False
@@ -150,12 +153,12 @@ async def find_field(ctx, name: str, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
     version = resolve_version(version if version is not None else "latest")
     if version is None:
         raise InvalidVersion("", True)
 
-    page = Page(5, MCPDownloader.database[version].search_field(name))
+    page = Page(5, get_database(version).search_field(name))
     await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
 
     # found = False
@@ -184,12 +187,12 @@ async def find_method(ctx, name: str, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
     version = resolve_version(version if version is not None else "latest")
     if version is None:
         raise InvalidVersion("", True)
 
-    page = Page(5, MCPDownloader.database[version].search_method(name))
+    page = Page(5, get_database(version).search_method(name))
     await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
 
     # found = False
@@ -217,12 +220,12 @@ async def find_parameter(ctx, name: str, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
     version = resolve_version(version if version is not None else "latest")
     if version is None:
         raise InvalidVersion("", True)
 
-    page = Page(5, MCPDownloader.database[version].search_parameters(name))
+    page = Page(5, get_database(version).search_parameters(name))
     await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
 
     # embed = Embed(title="List of MCP Mappings", color=0x2E4460)
@@ -248,10 +251,14 @@ async def find_class(ctx, name: str, version: Optional[str] = None):
     :return: None
     """
     if version is None:
-        version = get_user_options_from_context(ctx).DefaultMCPMinecraftVersion
+        version = (await get_user_options_from_context(ctx)).DefaultMCPMinecraftVersion
     version = resolve_version(version if version is not None else "latest")
     if version is None:
         raise InvalidVersion("", True)
 
-    page = Page(5, MCPDownloader.database[version].search_classes(name))
-    await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
\ No newline at end of file
+    page = Page(5, get_database(version).search_classes(name))
+    await page.show(ctx, title=f"List of MCP Mappings for {version}", colour=0x2E4460)
+
+
+# Commands can be answered from the databases on disk while the first update runs
+MCPDownloader.load_cache_in_background()
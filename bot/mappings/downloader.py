@@ -1,4 +1,6 @@
+from asyncio import Future, get_event_loop
 from collections import OrderedDict
+from contextvars import copy_context
 from json import loads, dumps
 from typing import List, Optional, Dict, Any, Tuple
 from abc import ABCMeta, abstractmethod
@@ -9,9 +11,10 @@ from csv import DictReader
 from zipfile import ZipFile
 
 from bot.page import PageEntry
-from sync import sync
-from utils import MASTER_PATH, default_representation, time
+from sync import sync, enter_stage, end_stage, record_bytes, record_objects
+from utils import MASTER_PATH, atomic_write, default_representation, time
 from utils.json import Json, JsonSerializable, serializable
+from utils.metrics import timed
 from requests import get
 from io import BytesIO
 from os import scandir, getenv
@@ -385,22 +388,26 @@ class MappingDatabase:
 
     def __init__(self, path: Path, mc_version: Optional[str] = None, snapshot: Optional[str] = None) -> None:
         self.__classes = []
+        self.__class_index = None
         self.__mc_version = mc_version
         self.__snapshot = snapshot
         self.__path = path
 
     def add_class(self, clazz: Class):
         self.__classes.append(clazz)
+        self.__class_index = None
 
     def save(self):
-        self.__path.write_text(
-            Json.dumps({"mc_version": self.__mc_version, "snapshot": self.__snapshot, "classes": self.__classes}, separators=(',', ':')))
+        with atomic_write(self.__path) as f:
+            Json.stream({"mc_version": self.__mc_version, "snapshot": self.__snapshot, "classes": self.__classes}, f,
+                        separators=(',', ':'))
 
     def load(self):
         data = Json.loads(self.__path.read_text())
         self.__mc_version = data["mc_version"]
         self.__snapshot = data["snapshot"]
         self.__classes = data["classes"]
+        self.__class_index = None
         # temp try to shrink file size
         # self.save()
 
@@ -416,6 +423,21 @@ class MappingDatabase:
     def classes(self) -> List[Class]:
         return self.__classes
 
+    def build_index(self):
+        self.__class_index = {clazz.intermediate_name: clazz for clazz in self.__classes}
+
+    def count_objects(self) -> int:
+        """
+        :return: The number of classes, fields, methods and constructors in the database
+        """
+        return sum(1 + len(clazz.fields) + len(clazz.methods) + len(clazz.constructors) for clazz in self.__classes)
+
+    def get_class(self, intermediate_name: str) -> Optional[Class]:
+        if self.__class_index is None:
+            self.build_index()
+        return self.__class_index.get(intermediate_name)
+
+    @timed(category="search")
     def search_field(self, search: str) -> Field:
         for clazz in self.__classes:
             result = clazz.search_field(search)
@@ -423,6 +445,7 @@ class MappingDatabase:
                 for r in result:
                     yield r
 
+    @timed(category="search")
     def search_method(self, search: str) -> Method:
         for clazz in self.__classes:
             result = clazz.search_method(search)
@@ -430,6 +453,7 @@ class MappingDatabase:
                 for r in result:
                     yield r
 
+    @timed(category="search")
     def search_parameters(self, search: str) -> Parameter:
         for clazz in self.__classes:
             result = clazz.search_parameters(search)
@@ -437,6 +461,7 @@ class MappingDatabase:
                 for r in result:
                     yield r
 
+    @timed(category="search")
     def search_classes(self, search: str) -> Class:
         for clazz in self.__classes:
             if matches(clazz.name, search):
@@ -535,16 +560,104 @@ class MCPDownloader(MappingDownloader):
     database = {}
 
     MCP_FILES = MAPPINGS / "mcp"
+    # The versions found by the last update, so they are known straight away on the next start
+    STATE_FILE = MAPPINGS / "mcp_state.json"
+
+    __versions_json = None
+    __cache_loaded: Optional[Future] = None
 
     @classmethod
-    @sync
-    async def update(cls):
-        from bot.forge import Versions
+    def load_cache_in_background(cls) -> Future:
+        """
+        Start loading the versions and databases left on disk by the last update, if they are not already loading
+
+        :return: The future which finishes once the cache is loaded
+        """
+        failed = cls.__cache_loaded is not None and cls.__cache_loaded.done() and \
+            (cls.__cache_loaded.cancelled() or cls.__cache_loaded.exception() is not None)
+        # A failed load is tried again rather than kept, so it cannot fail every later update too
+        if cls.__cache_loaded is None or failed:
+            cls.__cache_loaded = get_event_loop().run_in_executor(None, cls.load_cache)
+        return cls.__cache_loaded
+
+    @classmethod
+    @time
+    def load_cache(cls):
+        """
+        Load the versions and the up to date databases left on disk by the last update without downloading anything,
+        so that commands can be answered while the update runs
+        """
+        if cls.STATE_FILE.exists():
+            try:
+                state = loads(cls.STATE_FILE.read_text())
+                cls.__versions_json = state["versions"]
+                cls.versions = MCPVersions(state["versions"])
+                cls.minecraft_versions = OrderedDict(state["minecraft_versions"])
+                cls.latest_minecraft_version = state["latest_minecraft_version"]
+                cls.latest_minecraft_version_group = state["latest_minecraft_version_group"]
+                logger.info("Loaded MCP versions from the last update")
+            except Exception as e:
+                # The update downloads the versions again
+                logger.error(f"Ignoring unreadable MCP state {cls.STATE_FILE}")
+                logger.exception(e)
+
+        if not cls.MCP_FILES.exists():
+            return
+        for directory in scandir(cls.MCP_FILES):
+            path = Path(directory.path)
+            meta_file = path / "meta.json"
+            db_file = path / "db.json"
+            if not meta_file.exists() or not db_file.exists():
+                continue
+            try:
+                meta = loads(meta_file.read_text())
+                db = MappingDatabase(db_file)
+                db.load()
+                up_to_date = db.mc_version == meta["mc_version"] and db.snapshot == meta["snapshot"]
+            except Exception as e:
+                # Only this version waits for the update, the others are still loaded
+                logger.error(f"Skipping unreadable mappings in {path}")
+                logger.exception(e)
+                continue
+            if up_to_date:
+                cls.database.setdefault(db.mc_version, db)
+                logger.info(f"Loaded database for MC {db.mc_version} snapshot {db.snapshot} from disk")
+
+    @classmethod
+    def save_state(cls):
+        if cls.__versions_json is None:
+            return
+        with atomic_write(cls.STATE_FILE) as f:
+            f.write(dumps({
+                "versions": cls.__versions_json,
+                "minecraft_versions": cls.minecraft_versions,
+                "latest_minecraft_version": cls.latest_minecraft_version,
+                "latest_minecraft_version_group": cls.latest_minecraft_version_group
+            }, separators=(',', ':')))
+
+    @classmethod
+    def refresh(cls):
         cls.update_versions()
         cls.get_latest()
         cls.load_versions()
+
+    @classmethod
+    @sync
+    async def update(cls):
+        from bot.forge import Versions
+        # Answer commands from what is on disk first, then download and rebuild in the background
+        try:
+            await cls.load_cache_in_background()
+        except Exception as e:
+            # The refresh rebuilds whatever could not be loaded
+            logger.error("Failed to load the mappings from disk")
+            logger.exception(e)
+        # Copy the context so the stages of the refresh are recorded against this sync run
+        await get_event_loop().run_in_executor(None, copy_context().run, cls.refresh)
         logger.info("Waiting for minecraft versions")
+        enter_stage("fetch")
         await Versions.fetch_versions()
+        end_stage()
         logger.info("Finished waiting")
         mc_versions = OrderedDict()
         first = True
@@ -559,17 +672,25 @@ class MCPDownloader(MappingDownloader):
                     versions.append(version)
             mc_versions[mc_group] = versions
         cls.minecraft_versions = mc_versions
+        enter_stage("save")
+        cls.save_state()
+        end_stage()
         logger.info("Detected latest MCP minecraft versions")
 
     @classmethod
+    @time
     def update_versions(cls):
+        enter_stage("fetch")
         response = get(cls.VERSION_JSON)
+        record_bytes(len(response.content))
         if response.status_code == 200:
             result = loads(response.content)
+            cls.__versions_json = result
             cls.versions = MCPVersions(result)
             logger.info("Loaded MCP versions")
 
     @classmethod
+    @time
     def get_latest(cls):
         if not cls.MCP_FILES.exists():
             cls.MCP_FILES.mkdir(parents=True)
@@ -597,22 +718,29 @@ class MCPDownloader(MappingDownloader):
 
             if not latest:
                 try:
-                    zip_file = ZipFile(BytesIO(
-                        get(cls.MAPPINGS_URL_SNAPSHOT(version.mc_version, latest_snapshot.version), stream=True).content))
+                    enter_stage("fetch")
+                    content = get(cls.MAPPINGS_URL_SNAPSHOT(version.mc_version, latest_snapshot.version), stream=True).content
+                    record_bytes(len(content))
+                    enter_stage("extract")
+                    zip_file = ZipFile(BytesIO(content))
                     zip_file.extractall(path=path / "mcp")
 
                     url = cls.TSRGS_URL if version.mc_version >= new_forge else cls.SRGS_URL
 
                     if not found:
-                        zip_file = ZipFile(BytesIO(
-                            get(url(version.mc_version), stream=True).content))
+                        enter_stage("fetch")
+                        content = get(url(version.mc_version), stream=True).content
+                        record_bytes(len(content))
+                        enter_stage("extract")
+                        zip_file = ZipFile(BytesIO(content))
                         zip_file.extractall(path=path / "srg")
 
-                    meta_file.write_text(data=dumps({
-                        "mc_version": str(version.mc_version),
-                        "snapshot": latest_snapshot.version,
-                        "tsrg": version.mc_version >= new_forge
-                    }, separators=(',', ':')))
+                    with atomic_write(meta_file) as f:
+                        f.write(dumps({
+                            "mc_version": str(version.mc_version),
+                            "snapshot": latest_snapshot.version,
+                            "tsrg": version.mc_version >= new_forge
+                        }, separators=(',', ':')))
 
                     logger.info("Updated mappings for %s", version.mc_version)
                 except Exception as e:
@@ -620,6 +748,7 @@ class MCPDownloader(MappingDownloader):
                     logger.exception(e)
             else:
                 logger.info(f"Skipped {version.mc_version} as already on latest snapshot {latest_snapshot.version}")
+        end_stage()
 
     @classmethod
     @time
@@ -638,10 +767,16 @@ class MCPDownloader(MappingDownloader):
                 logger.info(f"Skipping directory {directory} as no meta file exists")
                 continue
 
+            loaded = cls.database.get(meta["mc_version"])
+            if loaded is not None and loaded.snapshot == meta["snapshot"]:
+                logger.info(f"Already loaded database for MC {loaded.mc_version} snapshot {loaded.snapshot}")
+                continue
+
             db_file = path / "db.json"
 
             db: MappingDatabase
 
+            enter_stage("parse")
             if db_file.exists():
                 db = MappingDatabase(db_file)
                 db.load()
@@ -728,7 +863,11 @@ class MCPDownloader(MappingDownloader):
                             #                                   Side(int(param["side"]) + 1)))
                             # clazz.add_constructor(c)
                         new_db.add_class(new_clazz)
+                    record_objects(new_db.count_objects())
+                    enter_stage("index")
+                    new_db.build_index()
                     cls.database[meta["mc_version"]] = new_db
+                    enter_stage("save")
                     new_db.save()
                     rmtree(mcp_folder.as_posix())
                     logger.info(f"Updated database for MC {new_db.mc_version} snapshot {new_db.snapshot}")
@@ -930,12 +1069,17 @@ class MCPDownloader(MappingDownloader):
                 for clazz in classes.values():
                     db.add_class(clazz)
 
+            record_objects(db.count_objects())
+            enter_stage("index")
+            db.build_index()
             cls.database[meta["mc_version"]] = db
+            enter_stage("save")
             db.save()
             rmtree(srg_folder.as_posix())
             rmtree(mcp_folder.as_posix())
             logger.info(f"Updated database for MC {db.mc_version} snapshot {db.snapshot}")
 
+        end_stage()
         logger.info("Loaded MCP data")
 
 
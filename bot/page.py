@@ -4,6 +4,12 @@ from typing import Generator, List
 from . import bot
 from discord import Embed, Message
 from enum import Enum, auto
+from time import perf_counter
+from utils.metrics import counter, timer
+
+
+FIRST_PAGE_TIME = timer("page_first_page_seconds", "How long it takes to find and send the first page of results")
+PAGE_TURNS = counter("page_turns_total", "How many times a page of results has been turned", ("direction",))
 
 
 class PageEntry(metaclass=ABCMeta):
@@ -83,6 +89,7 @@ class Page:
                 await self.__remove_reaction(message, self.NEXT_PAGE_EMOJI, user)
                 if self.show_next_page:
                     self.__page += 1
+                    PAGE_TURNS.inc(direction="next")
                     embed.clear_fields()
                     edit = True
                 else:
@@ -91,6 +98,7 @@ class Page:
                 await self.__remove_reaction(message, self.PREVIOUS_PAGE_EMOJI, user)
                 if self.show_previous_page:
                     self.__page -= 1
+                    PAGE_TURNS.inc(direction="previous")
                     embed.clear_fields()
                     edit = True
                 else:
@@ -103,6 +111,7 @@ class Page:
         message: Message = None
         embed = Embed(title=title, colour=colour)
         embed.set_footer(text="Made by CJMinecraft")
+        start = perf_counter()
         # While generating the results
         for result in self.__generator:
             self.__entries.append(result)
@@ -111,6 +120,7 @@ class Page:
                 if message is None:
                     # Will only happen once when the data is being generated
                     message = await ctx.send(embed=embed)
+                    FIRST_PAGE_TIME.observe(perf_counter() - start)
                     await self.__add_reaction(message, self.PREVIOUS_PAGE_EMOJI)
                     await self.__add_reaction(message, self.CANCEL_EMOJI)
                     await self.__add_reaction(message, self.NEXT_PAGE_EMOJI)
@@ -132,12 +142,14 @@ class Page:
                         await self.__remove_reaction(message, self.NEXT_PAGE_EMOJI, ctx.message.author)
                         if self.show_next_page:
                             self.__page += 1
+                            PAGE_TURNS.inc(direction="next")
                             embed.clear_fields()
                             break
                     elif action == PageActionResult.PREVIOUS_PAGE:
                         await self.__remove_reaction(message, self.PREVIOUS_PAGE_EMOJI, ctx.message.author)
                         if self.show_previous_page:
                             self.__page -= 1
+                            PAGE_TURNS.inc(direction="previous")
                             embed.clear_fields()
                             if await self.__handle_pages(message, channel, embed, ctx.message.author) == PageActionResult.CANCEL:
                                 return
@@ -148,6 +160,7 @@ class Page:
                 embed.description = "No results found"
             # Must not be enough results to fill one page
             await ctx.send(embed=embed)
+            FIRST_PAGE_TIME.observe(perf_counter() - start)
         else:
             # await message.edit(embed=embed)
             # await self.__cancel(message)
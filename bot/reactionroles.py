@@ -1,13 +1,31 @@
 from discord.ext.commands import TextChannelConverter, MessageConverter, RoleConverter, CheckFailure
-from main import db
 from . import bot, has_admin_role, is_dm, not_dm
+from .database import database, add
 from discord import Embed
 from models import ReactionRole
 from asyncio import TimeoutError
 from enum import Enum, auto
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple, Union
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from time import monotonic
+from logging import getLogger
+from utils.metrics import gauge, timer
 import discord
 
 
+logger = getLogger("reactionroles")
+
+
+# How long, in seconds, to collect role changes for a member before applying them
+ROLE_QUEUE_WINDOW = 1.0
+
+ROLE_QUEUE_DEPTH = gauge("role_queue_depth", "How many members have role changes waiting to be applied")
+ROLE_QUEUE_LAG = timer("role_queue_lag_seconds", "How long role changes wait between being queued and being sent",
+                       buckets=(0.5, 1, 1.5, 2, 3, 5, 10, 30, 60))
+ROLE_QUEUE_DEPTH.set(0)
+
+
 class ReactionRoleType(Enum):
     ADD_ON_REACT_REMOVE_ON_DELETE = auto()
     REMOVE_ON_REACT_ADD_ON_DELETE = auto()
@@ -15,6 +33,83 @@ class ReactionRoleType(Enum):
     REMOVE_ON_REACT = auto()
 
 
+class IndexedReactionRole(NamedTuple):
+    GuildId: int
+    ChannelId: int
+    RoleId: int
+    ReactionRoleType: int
+
+
+class ReactionRoleRow(NamedTuple):
+    GuildId: int
+    ChannelId: int
+    MessageId: int
+    EmojiName: str
+    EmojiAnimated: bool
+    EmojiId: Optional[int]
+    RoleId: int
+    ReactionRoleType: int
+
+
+# Message id -> emoji key -> reaction role, so reactions on other messages never touch the database
+reaction_role_index: Dict[int, Dict[Tuple[str, bool, Optional[int]], IndexedReactionRole]] = {}
+
+
+def index_reaction_role(rr: Union[ReactionRole, ReactionRoleRow]):
+    reaction_role_index.setdefault(rr.MessageId, {})[(rr.EmojiName, rr.EmojiAnimated, rr.EmojiId)] = \
+        IndexedReactionRole(rr.GuildId, rr.ChannelId, rr.RoleId, rr.ReactionRoleType)
+
+
+def unindex_reaction_role(rr: Union[ReactionRole, ReactionRoleRow]):
+    emojis = reaction_role_index.get(rr.MessageId)
+    if emojis is not None:
+        emojis.pop((rr.EmojiName, rr.EmojiAnimated, rr.EmojiId), None)
+        if len(emojis) == 0:
+            del reaction_role_index[rr.MessageId]
+
+
+def load_reaction_roles():
+    reaction_role_index.clear()
+    for rr in database.run_sync(lambda session: session.query(ReactionRole).all()):
+        index_reaction_role(rr)
+
+
+def pending_index_changes(session) -> List[Tuple[Callable, ReactionRoleRow]]:
+    return session.info.setdefault("reaction_role_changes", [])
+
+
+def copy_reaction_role(rr: ReactionRole) -> ReactionRoleRow:
+    # Copied at flush time, as the row is expired (or deleted) by the time the transaction commits
+    return ReactionRoleRow(rr.GuildId, rr.ChannelId, rr.MessageId, rr.EmojiName, rr.EmojiAnimated, rr.EmojiId,
+                           rr.RoleId, rr.ReactionRoleType)
+
+
+# Inserts and deletes are flushed before the transaction commits, so the index is only updated once it has committed.
+# Otherwise a failed commit would leave a reaction role in the index which is not in the database
+@event.listens_for(ReactionRole, "after_insert")
+def on_reaction_role_inserted(mapper, connection, target):
+    pending_index_changes(object_session(target)).append((index_reaction_role, copy_reaction_role(target)))
+
+
+@event.listens_for(ReactionRole, "after_delete")
+def on_reaction_role_deleted(mapper, connection, target):
+    pending_index_changes(object_session(target)).append((unindex_reaction_role, copy_reaction_role(target)))
+
+
+@event.listens_for(Session, "after_commit")
+def on_session_committed(session):
+    for change, rr in session.info.pop("reaction_role_changes", ()):
+        change(rr)
+
+
+@event.listens_for(Session, "after_rollback")
+def on_session_rolled_back(session):
+    session.info.pop("reaction_role_changes", None)
+
+
+load_reaction_roles()
+
+
 async def send_setup_message(ctx, message: str, part: int):
     embed = Embed(title=f"Reaction Roles - Setup part {part}", description=message, color=0x14c6e6)
     embed.set_footer(text="Made by CJMinecraft")
@@ -118,24 +213,99 @@ async def reaction_role(ctx):
             await send_rr_error(ctx, str(e))
 
     rr = ReactionRole(GuildId=channel.guild.id, ChannelId=channel.id, MessageId=message.id, EmojiName=emoji.name, EmojiAnimated=emoji.animated, EmojiId=emoji.id, RoleId=role.id, ReactionRoleType=role_type.value)
-    db.session.add(rr)
-    db.session.commit()
+    await database.run(add, rr)
 
     await send_complete(c, rr)
 
 
-def reaction_role_from_payload(payload):
-    from sqlalchemy import and_
-    return ReactionRole.query.filter(and_(
-        ReactionRole.GuildId == payload.guild_id, ReactionRole.ChannelId == payload.channel_id, ReactionRole.MessageId == payload.message_id, ReactionRole.EmojiName == payload.emoji.name, ReactionRole.EmojiAnimated == payload.emoji.animated, ReactionRole.EmojiId == payload.emoji.id)).first()
+def reaction_role_from_payload(payload) -> Optional[IndexedReactionRole]:
+    emojis = reaction_role_index.get(payload.message_id)
+    if emojis is None:
+        return None
+    rr = emojis.get((payload.emoji.name, payload.emoji.animated, payload.emoji.id))
+    if rr is None or rr.GuildId != payload.guild_id or rr.ChannelId != payload.channel_id:
+        return None
+    return rr
+
+
+class RoleQueue:
+    """
+    Queues the role changes for each member and applies every change made within a short window with a single edit,
+    so a member toggling a reaction repeatedly costs one request rather than one per reaction
+    """
+
+    def __init__(self, window: float) -> None:
+        self.__window = window
+        self.__pending: Dict[Tuple[int, int], Dict[int, bool]] = {}
+        self.__queued_at: Dict[Tuple[int, int], float] = {}
+        self.__members = {}
+        self.__lag = 0.0
+
+    def queue(self, member, guild_id: int, role_id: int, add: bool):
+        key = (guild_id, member.id)
+        changes = self.__pending.get(key)
+        if changes is None:
+            changes = self.__pending[key] = {}
+            self.__queued_at[key] = monotonic()
+            bot.loop.call_later(self.__window, lambda: bot.loop.create_task(self.__flush(key)))
+            ROLE_QUEUE_DEPTH.set(len(self.__pending))
+        # A later change to the same role replaces the earlier one
+        changes[role_id] = add
+        self.__members[key] = member
+
+    async def __flush(self, key: Tuple[int, int]):
+        changes = self.__pending.pop(key)
+        member = self.__members.pop(key)
+        queued_at = self.__queued_at.pop(key)
+        ROLE_QUEUE_DEPTH.set(len(self.__pending))
+        guild = bot.get_guild(key[0])
+        if guild is None:
+            return
+        # Prefer the cached member as it has the most recent roles
+        member = guild.get_member(key[1]) or member
+        current = {role.id: role for role in member.roles[1:]}
+        roles = dict(current)
+        for role_id, add in changes.items():
+            if add:
+                role = guild.get_role(role_id)
+                if role is not None:
+                    roles[role_id] = role
+            else:
+                roles.pop(role_id, None)
+        try:
+            if roles.keys() != current.keys():
+                await member.edit(roles=list(roles.values()))
+        except discord.HTTPException as e:
+            logger.error(f"Failed to update the roles of {member} in {guild}")
+            logger.exception(e)
+        self.__lag = monotonic() - queued_at
+        ROLE_QUEUE_LAG.observe(self.__lag)
+        logger.debug(f"Updated roles of {member} after {self.__lag:.2f}s, {self.depth} members queued")
+
+    @property
+    def depth(self) -> int:
+        """
+        :return: The number of members with role changes waiting to be applied
+        """
+        return len(self.__pending)
+
+    @property
+    def lag(self) -> float:
+        """
+        :return: The time in seconds between the last applied change being queued and being sent to Discord
+        """
+        return self.__lag
+
+
+role_queue = RoleQueue(ROLE_QUEUE_WINDOW)
 
 
-async def add_roles(user, guild_id, role_id):
-    await user.add_roles(discord.utils.get(bot.get_guild(guild_id).roles, id=role_id))
+def add_roles(user, guild_id, role_id):
+    role_queue.queue(user, guild_id, role_id, True)
 
 
-async def remove_roles(user, guild_id, role_id):
-    await user.remove_roles(discord.utils.get(bot.get_guild(guild_id).roles, id=role_id))
+def remove_roles(user, guild_id, role_id):
+    role_queue.queue(user, guild_id, role_id, False)
 
 
 @bot.event
@@ -146,9 +316,9 @@ async def on_raw_reaction_add(payload):
         rr = reaction_role_from_payload(payload)
         if rr is not None:
             if rr.ReactionRoleType == ReactionRoleType.ADD_ON_REACT.value or rr.ReactionRoleType == ReactionRoleType.ADD_ON_REACT_REMOVE_ON_DELETE.value:
-                await add_roles(payload.member, payload.guild_id, rr.RoleId)
+                add_roles(payload.member, payload.guild_id, rr.RoleId)
             elif rr.ReactionRoleType == ReactionRoleType.REMOVE_ON_REACT.value or rr.ReactionRoleType == ReactionRoleType.REMOVE_ON_REACT_ADD_ON_DELETE.value:
-                await remove_roles(payload.member, payload.guild_id, rr.RoleId)
+                remove_roles(payload.member, payload.guild_id, rr.RoleId)
 
 
 @bot.event
@@ -160,6 +330,6 @@ async def on_raw_reaction_remove(payload):
         rr = reaction_role_from_payload(payload)
         if rr is not None:
             if rr.ReactionRoleType == ReactionRoleType.ADD_ON_REACT_REMOVE_ON_DELETE.value:
-                await remove_roles(user, payload.guild_id, rr.RoleId)
+                remove_roles(user, payload.guild_id, rr.RoleId)
             elif rr.ReactionRoleType == ReactionRoleType.REMOVE_ON_REACT_ADD_ON_DELETE.value:
-                await add_roles(user, payload.guild_id, rr.RoleId)
+                add_roles(user, payload.guild_id, rr.RoleId)
@@ -1,7 +1,6 @@
-from main import db
 from models import ServerOptions
 from . import bot, is_dm, get_server_options_from_context, send_message, send_error, has_admin_role, \
-    get_user_options_from_context
+    get_user_options_from_context, save_options
 from discord import Embed
 from discord.ext.commands import RoleConverter, Context, CheckFailure
 from typing import Optional, List, Callable, Any
@@ -56,8 +55,8 @@ def get_setting_from_name(name: str):
     return setting
 
 
-def user_has_admin_role(ctx):
-    server_options = get_server_options_from_context(ctx)
+async def user_has_admin_role(ctx):
+    server_options = await get_server_options_from_context(ctx)
     if server_options.AdminRoleId == None:
         return True
     for role in ctx.author.roles:
@@ -80,7 +79,7 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
     #     await send_error(ctx, "Invalid Command", "The settings command is not valid within a DM")
     #     return
 
-    admin_role = user_has_admin_role(ctx)
+    admin_role = await user_has_admin_role(ctx)
 
     dm = is_dm(ctx)
 
@@ -88,8 +87,8 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
         # Print all of the settings
 
         if not dm:
-            server_options = get_server_options_from_context(ctx)
-        user_options = get_user_options_from_context(ctx)
+            server_options = await get_server_options_from_context(ctx)
+        user_options = await get_user_options_from_context(ctx)
 
         embed = Embed(title="Settings", color=0x14c6e6)
 
@@ -120,8 +119,8 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
             # invalid perms
             return
         if not dm:
-            server_options = get_server_options_from_context(ctx)
-        user_options = get_user_options_from_context(ctx)
+            server_options = await get_server_options_from_context(ctx)
+        user_options = await get_user_options_from_context(ctx)
         embed = Embed(title=f"Setting - {setting.name}", color=0x14c6e6)
         embed.add_field(name="Name", value=setting.name, inline=True)
         embed.add_field(name="Description", value=setting.description, inline=True)
@@ -140,7 +139,7 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
         raise Exception("Setting not found")
 
     if setting.user_setting:
-        user_options = get_user_options_from_context(ctx)
+        user_options = await get_user_options_from_context(ctx)
         try:
             result = None
             try:
@@ -150,12 +149,12 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
                     raise e
 
             setattr(user_options, setting.field_name, result)
-            db.session.commit()
+            save_options(user_options)
         except Exception as e:
             await send_error(ctx, "An error occurred", str(e))
             return
     elif not setting.user_setting and admin_role and not dm:
-        server_options = get_server_options_from_context(ctx)
+        server_options = await get_server_options_from_context(ctx)
         try:
             result = None
             try:
@@ -165,7 +164,7 @@ async def settings(ctx, name: Optional[str], value: Optional[str]):
                     raise e
 
             setattr(server_options, setting.field_name, result)
-            db.session.commit()
+            save_options(server_options)
         except Exception as e:
             await send_error(ctx, "An error occurred", str(e))
             return
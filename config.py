@@ -3,6 +3,10 @@ Configuration options for the Flask application
 """
 
 import os
+from dotenv import load_dotenv
+
+# Loaded here, as every option below is read from the environment when config is imported
+load_dotenv()
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(os.path.join(BASEDIR, 'database'), 'database.db')
@@ -11,3 +15,45 @@ DEBUG = False
 SECRET_KEY = os.getenv("FLASK_SECRET_KEY")
 CACHE_TYPE = 'simple'
 CACHE_DEFAULT_TIMEOUT = 300
+WEBSITE_HOST = os.getenv("WEBSITE_HOST", "0.0.0.0")
+WEBSITE_PORT = int(os.getenv("WEBSITE_PORT", 8080))
+# Either "development" for Werkzeug's dev server or "waitress" for a multithreaded production server
+WEBSITE_SERVER = os.getenv("WEBSITE_SERVER", "development")
+WEBSITE_THREADS = int(os.getenv("WEBSITE_THREADS", 4))
+# The number of threads the bot uses to run database queries
+BOT_DATABASE_WORKERS = int(os.getenv("BOT_DATABASE_WORKERS", 1))
+# The number of server and user options kept in memory by the bot
+OPTIONS_CACHE_SIZE = int(os.getenv("OPTIONS_CACHE_SIZE", 10000))
+# How often, in seconds, the bot writes changed options to the database
+OPTIONS_WRITE_INTERVAL = float(os.getenv("OPTIONS_WRITE_INTERVAL", 5))
+# Either "default" to use SQLite as it comes or "tuned" for WAL journaling, the pragmas below and a connection pool
+# shared by the bot and the website
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "tuned")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384)),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 64 * 1024 * 1024)),
+    "busy_timeout": 5000
+}
+if SQLITE_PROFILE == "tuned":
+    from sqlalchemy.pool import QueuePool
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": QueuePool,
+        # Enough connections for every bot database worker and website thread at once
+        "pool_size": BOT_DATABASE_WORKERS + WEBSITE_THREADS,
+        "max_overflow": 2,
+        "connect_args": {"check_same_thread": False}
+    }
+# Either "pastebin" to upload attachments to Pastebin or "local" to store them on disk and serve them from the website
+PASTE_BACKEND = os.getenv("PASTE_BACKEND", "pastebin")
+PASTE_STORE = os.getenv("PASTE_STORE", os.path.join(BASEDIR, 'pastes'))
+# The address the website is reached at, used to link to pastes stored locally
+PASTE_BASE_URL = os.getenv("PASTE_BASE_URL", f"http://localhost:{WEBSITE_PORT}")
+PASTE_EXPIRY_DAYS = int(os.getenv("PASTE_EXPIRY_DAYS", 30))
+# Where the sampling profiler writes collapsed stacks, and the token the website's profiler endpoint requires (the
+# endpoint is disabled when it is not set)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASEDIR, 'profiles'))
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 300))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.01))
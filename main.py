@@ -1,17 +1,17 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from dotenv import load_dotenv
 import config
 import logging
 
 logging.basicConfig(format="[%(asctime)s] [%(name)s/%(levelname)s]: %(message)s", datefmt="%H:%M:%S", level=logging.INFO)
 
-load_dotenv()
-
 app = Flask(__name__, template_folder="website/templates/", static_folder="website/static/")
 app.config.from_object(config)
 
 db = SQLAlchemy(app)
+if app.config["SQLITE_PROFILE"] == "tuned":
+    from utils.database import apply_sqlite_pragmas
+    apply_sqlite_pragmas(db.engine, app.config["SQLITE_PRAGMAS"])
 import models
 db.create_all()
 db.session.commit()
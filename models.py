@@ -1,7 +1,10 @@
 from main import db
+from sqlalchemy import inspect
 
 
 class ReactionRole(db.Model):
+    __table_args__ = (db.Index("ix_reaction_role_lookup", "MessageId", "EmojiName", "EmojiId"),)
+
     ReactionRoleId = db.Column(db.Integer, primary_key=True)
     GuildId = db.Column(db.Integer, nullable=False)
     ChannelId = db.Column(db.Integer, nullable=False)
@@ -21,3 +24,21 @@ class ServerOptions(db.Model):
 class UserOptions(db.Model):
     UserId = db.Column(db.Integer, primary_key=True)
     DefaultMCPMinecraftVersion = db.Column(db.TEXT, default="latest")
+
+
+def create_missing_indexes():
+    """
+    Create any indexes which have been declared since the database was created, as db.create_all only creates the
+    missing tables
+    """
+    inspector = inspect(db.engine)
+    for table in db.Model.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+
+
+# Run here rather than in main, as models may be imported before main has finished
+db.create_all()
+create_missing_indexes()
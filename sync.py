@@ -1,16 +1,236 @@
-import aioschedule as schedule
 import inspect
 import logging
+from contextvars import ContextVar
+from json import loads, dumps
+from os import getenv
+from pathlib import Path
+from threading import Lock
+from time import time, perf_counter
+from typing import Dict, List, Optional
 from discord import Embed, Colour
+from utils import MASTER_PATH, atomic_write
+from utils.scheduler import scheduler
 
 
 logger = logging.getLogger("sync")
 
 
+SYNC_INTERVAL = float(getenv("SYNC_INTERVAL_HOURS", 12)) * 60 * 60
+# How long, in seconds, a sync function may run before it is cancelled
+SYNC_TIMEOUT = float(getenv("SYNC_TIMEOUT", 60 * 60))
+# The most, in seconds, added at random to when each sync function runs so they do not all start at once
+SYNC_JITTER = float(getenv("SYNC_JITTER", 5 * 60))
+
+SYNC_HISTORY_FILE = MASTER_PATH / "database" / "sync_history.json"
+SYNC_HISTORY_SIZE = int(getenv("SYNC_HISTORY_SIZE", 100))
+
+
+class SyncRun:
+    """
+    The timings and counts recorded by one run of a sync function. Time is split into named stages, and switching to
+    a stage ends the one before it, so long functions can be instrumented without restructuring them
+    """
+
+    def __init__(self, name: str) -> None:
+        self.__name = name
+        self.__started = time()
+        self.__duration: Optional[float] = None
+        self.__status = "running"
+        self.__error: Optional[str] = None
+        self.__stages: Dict[str, float] = {}
+        self.__stage: Optional[str] = None
+        self.__stage_start = 0.0
+        self.__bytes = 0
+        self.__objects = 0
+        # Stages may be recorded from executor threads
+        self.__lock = Lock()
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def started(self) -> float:
+        return self.__started
+
+    @property
+    def duration(self) -> Optional[float]:
+        return self.__duration
+
+    @property
+    def status(self) -> str:
+        return self.__status
+
+    @property
+    def error(self) -> Optional[str]:
+        return self.__error
+
+    @property
+    def stages(self) -> Dict[str, float]:
+        return dict(self.__stages)
+
+    @property
+    def bytes(self) -> int:
+        return self.__bytes
+
+    @property
+    def objects(self) -> int:
+        return self.__objects
+
+    def __end_stage(self):
+        if self.__stage is not None:
+            self.__stages[self.__stage] = self.__stages.get(self.__stage, 0) + perf_counter() - self.__stage_start
+            self.__stage = None
+
+    def enter_stage(self, stage: str):
+        with self.__lock:
+            self.__end_stage()
+            self.__stage = stage
+            self.__stage_start = perf_counter()
+
+    def end_stage(self):
+        with self.__lock:
+            self.__end_stage()
+
+    def add_bytes(self, count: int):
+        with self.__lock:
+            self.__bytes += count
+
+    def add_objects(self, count: int):
+        with self.__lock:
+            self.__objects += count
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end_stage()
+        self.__duration = time() - self.__started
+        self.__status = "success" if error is None else "failed"
+        self.__error = None if error is None else repr(error)
+
+    def to_json(self) -> dict:
+        return {
+            "name": self.__name,
+            "started": self.__started,
+            "duration": self.__duration,
+            "status": self.__status,
+            "error": self.__error,
+            "stages": self.stages,
+            "bytes": self.__bytes,
+            "objects": self.__objects
+        }
+
+
+class SyncHistory:
+    """
+    The most recent sync runs, saved to disk after every run
+    """
+
+    def __init__(self, path: Path, size: int) -> None:
+        self.__path = path
+        self.__size = size
+        self.__runs: List[dict] = []
+        if path.exists():
+            try:
+                self.__runs = loads(path.read_text())
+            except ValueError:
+                logger.warning(f"Ignoring corrupt sync history {path}")
+
+    @property
+    def runs(self) -> List[dict]:
+        """
+        :return: The recorded runs, oldest first
+        """
+        return list(self.__runs)
+
+    def add(self, run: SyncRun):
+        self.__runs.append(run.to_json())
+        del self.__runs[:-self.__size]
+        self.save()
+
+    def save(self):
+        with atomic_write(self.__path) as f:
+            f.write(dumps(self.__runs, separators=(',', ':')))
+
+
+sync_history = SyncHistory(SYNC_HISTORY_FILE, SYNC_HISTORY_SIZE)
+
+# The run of the sync function being executed, copied into executor threads with contextvars.copy_context
+current_run: ContextVar[Optional[SyncRun]] = ContextVar("sync_run", default=None)
+
+
+def enter_stage(stage: str):
+    """
+    Start timing the given stage of the current sync run, ending the previous stage
+
+    :param stage: The name of the stage, e.g. fetch, extract, parse, index or save
+    """
+    run = current_run.get()
+    if run is not None:
+        run.enter_stage(stage)
+
+
+def end_stage():
+    run = current_run.get()
+    if run is not None:
+        run.end_stage()
+
+
+def record_bytes(count: int):
+    """
+    :param count: The number of bytes downloaded by the current sync run
+    """
+    run = current_run.get()
+    if run is not None:
+        run.add_bytes(count)
+
+
+def record_objects(count: int):
+    """
+    :param count: The number of objects built by the current sync run
+    """
+    run = current_run.get()
+    if run is not None:
+        run.add_objects(count)
+
+
 __functions = []
 
 
-async def schedule_functions():
+async def notify(title: str, description: str):
+    from bot import bot, CJ_USER_ID
+    user = bot.get_user(CJ_USER_ID)
+    if user is None:
+        return
+    embed = Embed(title=title, description=description, color=Colour.gold())
+    embed.set_footer(text="Made by CJMinecraft")
+    channel = await user.create_dm()
+    await channel.send(embed=embed)
+
+
+def create_wrapper(func, kwargs):
+    async def wrapper():
+        await notify("Running Sync Function", f"Running sync function `{func.__name__}`")
+
+        run = SyncRun(func.__name__)
+        token = current_run.set(run)
+        try:
+            await func(**kwargs)
+            run.finish()
+        except BaseException as e:
+            run.finish(e)
+            raise
+        finally:
+            current_run.reset(token)
+            sync_history.add(run)
+
+        await notify("Finished Sync Function", f"Finished sync function `{func.__name__}` in {run.duration:.1f}s")
+
+    return wrapper
+
+
+def schedule_functions():
+    """
+    Schedule every sync function, running them all straight away and at the same time
+    """
     for func in __functions:
         kwargs = {}
         if inspect.isfunction(func):
@@ -18,25 +238,8 @@ async def schedule_functions():
             if isinstance(clazz, type):
                 kwargs["cls"] = clazz
 
-        async def wrapper():
-            from bot import bot, CJ_USER_ID
-            user = bot.get_user(CJ_USER_ID)
-
-            embed = Embed(title="Running Sync Function", description=f"Running sync function `{func.__name__}`", color=Colour.gold())
-            embed.set_footer(text="Made by CJMinecraft")
-            channel = await user.create_dm()
-            await channel.send(embed=embed)
-
-            await func(**kwargs)
-
-            embed = Embed(title="Finished Sync Function", description=f"Finished sync function `{func.__name__}`",
-                          color=Colour.gold())
-            embed.set_footer(text="Made by CJMinecraft")
-            channel = await user.create_dm()
-            await channel.send(embed=embed)
-
-        await wrapper()
-        schedule.every(12).hours.do(wrapper)
+        scheduler.every(SYNC_INTERVAL, create_wrapper(func, kwargs), name=func.__name__, timeout=SYNC_TIMEOUT,
+                        jitter=SYNC_JITTER, run_now=True)
 
 
 def sync(func):
@@ -1,6 +1,10 @@
+from contextlib import contextmanager
+from inspect import getattr_static, isroutine
+from os import fsync, getpid, replace
 from pathlib import Path
+from threading import get_ident, local
 from types import FunctionType, MethodType, MemberDescriptorType
-from typing import Optional, Type, List, Any, Union
+from typing import IO, Dict, Iterator, Optional, Type, List, Union
 
 
 def __get_master_path() -> Path:
@@ -24,14 +28,41 @@ def __get_master_path() -> Path:
 MASTER_PATH = __get_master_path()
 
 
-def _create_repr(clazz, ignore_attributes: Optional[List[str]] = None, ignore_types: Optional[List[type]] = None) \
-        -> None:
+# How deeply default representations nest within each other before the inner ones are shortened to Name(...), and the
+# length they are cut off at
+REPR_MAX_DEPTH = 2
+REPR_MAX_LENGTH = 1000
+
+# The objects whose default representations are being created by each thread
+_representing = local()
+
+
+def _get_class_attributes(clazz: Type, ignore_attributes: List[str]) -> List[str]:
+    """
+    :param clazz: The class to get the attributes of
+    :param ignore_attributes: The attributes which should be ignored
+    :return: The names of the public attributes of the class (e.g. properties) which are not methods
+    """
+    attributes = []
+    for name in dir(clazz):
+        if name.startswith('_') or name in ignore_attributes:
+            continue
+        attribute = getattr_static(clazz, name)
+        if not isroutine(attribute) and not isinstance(attribute, (staticmethod, classmethod, type)):
+            attributes.append(name)
+    return attributes
+
+
+def _create_repr(clazz, ignore_attributes: Optional[List[str]] = None, ignore_types: Optional[List[type]] = None,
+                 max_depth: int = REPR_MAX_DEPTH, max_length: int = REPR_MAX_LENGTH) -> None:
     """
     Create the __repr__ function for the given class with the given attributes to ignore
 
     :param clazz: The class containing the attributes
     :param ignore_attributes: The attributes which should be ignored
     :param ignore_types: The attribute types to ignore
+    :param max_depth: How deeply representations may nest before being shortened
+    :param max_length: The length representations are cut off at
     :return: None
     """
     # import inspect
@@ -43,6 +74,8 @@ def _create_repr(clazz, ignore_attributes: Optional[List[str]] = None, ignore_ty
         ignore_attributes = []
     if ignore_types is None:
         ignore_types = []
+    # The attributes of each class (including subclasses) are only worked out the first time one is represented
+    class_attributes: Dict[type, List[str]] = {}
 
     # Construct the __repr__ function
     def represent(self) -> str:
@@ -53,13 +86,41 @@ def _create_repr(clazz, ignore_attributes: Optional[List[str]] = None, ignore_ty
         :param self: The object to get the attributes of
         :return: The object converted to a string
         """
-
-        # Get all of the attributes which are public and have not got a name in ignore_attributes and aren't of a
-        # type in ignore_types
-        attributes = [f"{name}={repr(getattr(self, name))}" for name in list(filter(
-            lambda name: name not in ignore_attributes and not (name.startswith('_'))
-            and not callable(getattr(self, name)) and type(getattr(self, name)) not in ignore_types, dir(self)))]
-        return f"{self.__class__.__name__}({', '.join(attributes)})"  # Return the formatted string
+        name = self.__class__.__name__
+        representing = getattr(_representing, "objects", None)
+        if representing is None:
+            representing = _representing.objects = []
+        # Mappings refer to their parent, so stop at cycles as well as deep nesting
+        if len(representing) >= max_depth or any(o is self for o in representing):
+            return f"{name}(...)"
+
+        attribute_names = class_attributes.get(type(self))
+        if attribute_names is None:
+            attribute_names = class_attributes[type(self)] = _get_class_attributes(type(self), ignore_attributes)
+        instance_attributes = [attribute for attribute in getattr(self, "__dict__", ())
+                               if not attribute.startswith('_') and attribute not in ignore_attributes]
+        if len(instance_attributes) > 0:
+            attribute_names = sorted(set(attribute_names).union(instance_attributes))
+
+        representing.append(self)
+        try:
+            # Get all of the attributes which are not callable and aren't of a type in ignore_types
+            attributes = []
+            length = len(name)
+            for attribute in attribute_names:
+                value = getattr(self, attribute)
+                if not callable(value) and type(value) not in ignore_types:
+                    attributes.append(f"{attribute}={repr(value)}")
+                    length += len(attributes[-1]) + 2
+                    # The rest would be cut off anyway
+                    if length > max_length:
+                        break
+        finally:
+            representing.pop()
+        representation = f"{name}({', '.join(attributes)})"  # Return the formatted string
+        if len(representation) > max_length:
+            return representation[:max_length - 4] + "...)"
+        return representation
 
     # Override the functions
     clazz.__repr__ = represent
@@ -67,7 +128,8 @@ def _create_repr(clazz, ignore_attributes: Optional[List[str]] = None, ignore_ty
 
 # noinspection PyUnresolvedReferences
 def default_representation(clazz_: Optional[Type] = None, ignore_attributes: Optional[List[str]] = None,
-                           ignore_types: Optional[List[type]] = None):
+                           ignore_types: Optional[List[type]] = None, max_depth: int = REPR_MAX_DEPTH,
+                           max_length: int = REPR_MAX_LENGTH):
     """
     Automatically creates the __repr__ overrides by analysing the instance for the values of all the attributes.
 
@@ -90,6 +152,8 @@ def default_representation(clazz_: Optional[Type] = None, ignore_attributes: Opt
     :param clazz_: The class to add the default representation to
     :param ignore_attributes: The attributes of this class to ignore
     :param ignore_types: The attribute types to ignore
+    :param max_depth: How deeply representations may nest before being shortened to Name(...)
+    :param max_length: The length representations are cut off at
     :return: The updated class
     """
 
@@ -100,7 +164,7 @@ def default_representation(clazz_: Optional[Type] = None, ignore_attributes: Opt
         :param clazz: The class to decorate
         :return: The decorated class
         """
-        _create_repr(clazz, ignore_attributes, ignore_types)
+        _create_repr(clazz, ignore_attributes, ignore_types, max_depth, max_length)
         return clazz
 
     return decorator(clazz_) if clazz_ is not None else decorator
@@ -136,7 +200,8 @@ def get_container_class(method: Union[MethodType, FunctionType, MemberDescriptor
 
 def time(f: FunctionType) -> FunctionType:
     """
-    Time how long it takes for the provided function to execute and output to the console.
+    Time how long it takes for the provided function to execute, recording it in the function_duration_seconds
+    histogram of utils.metrics.
 
     This is a decorator so can be used e.g.\n
     >>> def example_function():
@@ -151,36 +216,34 @@ def time(f: FunctionType) -> FunctionType:
     :return: The wrapper of the function
     """
 
-    from time import time
-    import inspect
+    from utils.metrics import timed
+    return timed(f)
 
-    mod = inspect.getmodule(f)
 
-    def wrapper(*args, **kwargs) -> Any:
-        """
-        A wrapper function to decorate a function, which means when the function is executed, it is timed
+@contextmanager
+def atomic_write(path: Path, mode: str = "w", **kwargs) -> Iterator[IO]:
+    """
+    Open a temporary file next to the given path, which replaces the path once everything has been written. Anything
+    reading the path (including the next start after a crash) sees either the old or the new contents, never part of
+    the new contents.
 
-        :param args: The arguments of the function
-        :param kwargs: The key word arguments of the function
-        :return: The return arguments of the function
-        """
-        start = time()  # Get the start time
-        ret = f(*args, **kwargs)  # Call the function
-
-        clazz = get_container_class(f)  # Get the container class of the function
-        # Get the name of the function
-        if mod is None:
-            if clazz is None:
-                name = f"__main__.{f.__name__}"
-            else:
-                name = f"__main__.{clazz.__name__}.{f.__name__}"
-        else:
-            if clazz is None:
-                name = f"{mod.__name__}.{f.__name__}"
-            else:
-                name = f"{mod.__name__}.{clazz.__name__}.{f.__name__}"
-
-        print("Took %s seconds to execute %s" % ("{:.2f}".format(time() - start), name))
-        return ret
-
-    return wrapper
+    >>> with atomic_write(Path("db.json")) as f:
+    ...     f.write("{}")
+
+    :param path: The path to write to
+    :param mode: The mode to open the temporary file with, either "w" or "wb"
+    :param kwargs: The keyword arguments for open, e.g. encoding
+    :return: A context manager giving the temporary file
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Unique per thread so that concurrent writes of the same path do not write into each other's files
+    temporary = path.with_name(f".{path.name}.{getpid()}.{get_ident()}.tmp")
+    try:
+        with temporary.open(mode, **kwargs) as f:
+            yield f
+            f.flush()
+            fsync(f.fileno())
+        replace(temporary, path)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
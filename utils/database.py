@@ -0,0 +1,217 @@
+"""
+Helpers which run blocking database work away from the event loop
+"""
+
+__all__ = ['AsyncDatabase', 'ReadThroughCache', 'WriteBehindBuffer', 'apply_sqlite_pragmas']
+
+from asyncio import get_event_loop, sleep
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from typing import Any, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, sessionmaker
+from utils.metrics import timed
+
+
+T = TypeVar('T')
+
+
+logger = getLogger("database")
+
+
+def apply_sqlite_pragmas(engine, pragmas: Dict[str, Any]):
+    """
+    Set the given pragmas on every new connection the engine makes to a SQLite database
+
+    :param engine: The engine to configure
+    :param pragmas: The pragma names and their values
+    """
+    def on_connect(connection, _):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    event.listen(engine, "connect", on_connect)
+
+
+class AsyncDatabase:
+    """
+    Runs database work on a pool of worker threads. Every unit of work gets its own session which is committed and
+    closed once the work is done, so work never blocks the event loop and never shares a session with anything else
+    """
+
+    def __init__(self, engine, workers: int = 1) -> None:
+        # Objects are kept usable after their session closes so they can be handed back to the event loop
+        self.__session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="database")
+
+    @timed
+    def run_sync(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run the given function with a new session in the current thread, committing the session if it succeeds
+
+        :param func: The function to run, which takes the session followed by the arguments
+        :param args: The arguments for the function
+        :return: The result of the function
+        """
+        session: Session = self.__session_factory()
+        try:
+            result = func(session, *args)
+            session.commit()
+            return result
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @timed(category="database")
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """
+        Run the given function with a new session on one of the worker threads, committing the session if it succeeds
+
+        :param func: The function to run, which takes the session followed by the arguments
+        :param args: The arguments for the function
+        :return: The result of the function
+        """
+        return await get_event_loop().run_in_executor(self.__executor, partial(self.run_sync, func, *args))
+
+    def shutdown(self):
+        """
+        Wait for any queued work to finish and stop the worker threads
+        """
+        self.__executor.shutdown(wait=True)
+
+
+class ReadThroughCache(Generic[T]):
+    """
+    A least recently used cache in front of the database. Missing values are loaded through an AsyncDatabase and
+    kept until they are evicted, so repeated reads of the same key never reach the database
+    """
+
+    def __init__(self, database: AsyncDatabase, loader: Callable[[Session, Hashable], T], size: int) -> None:
+        self.__database = database
+        self.__loader = loader
+        self.__size = size
+        self.__values: 'OrderedDict[Hashable, T]' = OrderedDict()
+
+    async def get(self, key: Hashable) -> T:
+        """
+        Get the value for the given key, loading it from the database if it is not cached
+
+        :param key: The key of the value
+        :return: The value
+        """
+        if key in self.__values.keys():
+            self.__values.move_to_end(key)
+            return self.__values[key]
+        value = await self.__database.run(self.__loader, key)
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: T):
+        """
+        Store the value for the given key, evicting the least recently used value if the cache is full
+
+        :param key: The key of the value
+        :param value: The value
+        """
+        self.__values[key] = value
+        self.__values.move_to_end(key)
+        while len(self.__values) > self.__size:
+            self.__values.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        Remove the value for the given key so that it is loaded from the database next time
+
+        :param key: The key of the value
+        """
+        self.__values.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+
+class WriteBehindBuffer:
+    """
+    Collects new and changed rows and writes them all to the database in a single transaction at a regular interval,
+    rather than committing every change on its own. Only the latest values of each row are written
+    """
+
+    def __init__(self, database: AsyncDatabase, interval: float) -> None:
+        self.__database = database
+        self.__interval = interval
+        self.__pending: Dict[Tuple[type, Hashable], Dict[str, Any]] = {}
+
+    def queue(self, instance):
+        """
+        Queue the current values of the given row to be written on the next flush
+
+        :param instance: The mapped object to write
+        """
+        mapper = inspect(instance).mapper
+        key = (mapper.class_, tuple(mapper.primary_key_from_instance(instance)))
+        # Copy the values now so that later changes to the object are not written half way through a flush
+        self.__pending[key] = {attribute.key: getattr(instance, attribute.key) for attribute in mapper.column_attrs}
+
+    def __take(self) -> Dict[Tuple[type, Hashable], Dict[str, Any]]:
+        pending = self.__pending
+        self.__pending = {}
+        return pending
+
+    def __restore(self, pending: Dict[Tuple[type, Hashable], Dict[str, Any]]):
+        for key, values in pending.items():
+            # Anything queued since the failed flush is newer so takes priority
+            self.__pending.setdefault(key, values)
+
+    @staticmethod
+    def __write(session: Session, pending: Dict[Tuple[type, Hashable], Dict[str, Any]]):
+        identities: Dict[type, list] = {}
+        for clazz, identity in pending.keys():
+            identities.setdefault(clazz, []).append(identity)
+        for clazz, keys in identities.items():
+            primary_key = inspect(clazz).primary_key
+            if len(primary_key) == 1:
+                # Load the existing rows in one query so that merge finds them in the session rather than querying
+                # for each row
+                for i in range(0, len(keys), 500):
+                    session.query(clazz).filter(primary_key[0].in_([key[0] for key in keys[i:i + 500]])).all()
+        for (clazz, _), values in pending.items():
+            session.merge(clazz(**values))
+
+    async def flush(self):
+        """
+        Write every queued row in a single transaction. Rows which fail to be written are queued again
+        """
+        pending = self.__take()
+        if len(pending) == 0:
+            return
+        try:
+            await self.__database.run(WriteBehindBuffer.__write, pending)
+        except Exception as e:
+            logger.error(f"Failed to write {len(pending)} rows, will try again")
+            logger.exception(e)
+            self.__restore(pending)
+
+    def flush_sync(self):
+        """
+        Write every queued row in a single transaction from the current thread, for use once the event loop has stopped
+        """
+        pending = self.__take()
+        if len(pending) > 0:
+            self.__database.run_sync(WriteBehindBuffer.__write, pending)
+
+    async def run(self):
+        """
+        Flush the queued rows forever at the buffer's interval
+        """
+        while True:
+            await sleep(self.__interval)
+            await self.flush()
+
+    def __len__(self) -> int:
+        return len(self.__pending)
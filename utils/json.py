@@ -6,11 +6,33 @@ __all__ = ['serializable', 'JsonSerializable', 'Json']
 
 from json import JSONEncoder, loads, dumps, load, dump
 from abc import ABCMeta, abstractmethod
-from typing import Dict, List, Type, Any, Optional
+from itertools import count
+from typing import Dict, List, Type, Any, Optional, Tuple, IO
 from bidict import bidict
 
 
 _serializers = bidict({})  # Stores a list of serializable object classes
+# Every key a serialized object may be stored under, to the priority of the key and the class to deserialize it with.
+# The priority keeps the order the keys were checked in before the table existed: by when the class was registered,
+# then by how the key is spelled
+_deserializers: Dict[str, Tuple[Tuple[int, int], Type]] = {}
+_registrations = count()
+
+
+def _register(name: str, clazz: Type):
+    """
+    Register a class under the given name, adding every spelling of its key to the dispatch table
+
+    :param name: The name the class is serialized under
+    :param clazz: The class
+    :return: None
+    """
+    _serializers[name] = clazz
+    registration = next(_registrations)
+    keys = (f"_{name}_", f"_{clazz.__name__}_", f"__{name}__", f"__{clazz.__name__}__")
+    for spelling, key in enumerate(keys):
+        # The class registered first keeps the key
+        _deserializers.setdefault(key, ((registration, spelling), clazz))
 
 
 def serializable(clazz_: Optional[Type] = None, class_names: Optional[List[str]] = None, short_name: Optional[str] = None) -> Type:
@@ -47,10 +69,10 @@ def serializable(clazz_: Optional[Type] = None, class_names: Optional[List[str]]
         if not issubclass(clazz, JsonSerializable):
             raise AttributeError("Cannot mark class as json serializable if it isn't a subclass of JsonSerializable")
         if class_names is None:
-            _serializers[short_name if short_name is not None else clazz_.__name__] = clazz
+            _register(short_name if short_name is not None else clazz_.__name__, clazz)
         else:
             for name in class_names:
-                _serializers[name] = clazz
+                _register(name, clazz)
         return clazz
     return wrapper if clazz_ is None else wrapper(clazz_)
 
@@ -105,16 +127,50 @@ def _deserialize(o: Dict[str, Any]):
     :param o: The object to deserialize
     :return: The deserialized form of the object
     """
-    for name, serializer in _serializers.items():
-        if f"_{name}_" in o.keys():
-            return serializer.deserialize(o[f"_{name}_"])
-        if f"_{serializer.__name__}_" in o.keys():
-            return serializer.deserialize(o[f"_{serializer.__name__}_"])
-        if f"__{name}__" in o.keys():
-            return serializer.deserialize(o[f"__{name}__"])
-        if f"__{serializer.__name__}__" in o.keys():
-            return serializer.deserialize(o[f"__{serializer.__name__}__"])
-    return o
+    if len(o) == 1:
+        # Serialized objects are always written as a single key, so this is the path almost every object takes
+        for key, value in o.items():
+            entry = _deserializers.get(key)
+            return o if entry is None else entry[1].deserialize(value)
+    # Anything else is either a plain dictionary or was written with other keys alongside the serialized object, in
+    # which case the key with the highest priority wins
+    match = None
+    for key in o:
+        entry = _deserializers.get(key)
+        if entry is not None and (match is None or entry[0] < match[0]):
+            match = (entry[0], entry[1], key)
+    return o if match is None else match[1].deserialize(o[match[2]])
+
+
+def _stream(o: Any, fp: IO[str], encoder: _JsonEncoder):
+    """
+    Write the given object to the file a piece at a time. Lists and dictionaries are walked here so that the whole
+    document never has to be held in memory, and everything inside them is encoded by the C encoder in one go
+
+    :param o: The object to write
+    :param fp: The file to write to
+    :param encoder: The encoder for everything which is not walked
+    :return: None
+    """
+    if isinstance(o, (list, tuple)):
+        fp.write("[")
+        for i, value in enumerate(o):
+            if i > 0:
+                fp.write(encoder.item_separator)
+            _stream(value, fp, encoder)
+        fp.write("]")
+    # Other keys are converted to strings by the encoder, which is left to do it
+    elif isinstance(o, dict) and all(isinstance(key, str) for key in o.keys()):
+        fp.write("{")
+        for i, (key, value) in enumerate(o.items()):
+            if i > 0:
+                fp.write(encoder.item_separator)
+            fp.write(encoder.encode(key))
+            fp.write(encoder.key_separator)
+            _stream(value, fp, encoder)
+        fp.write("}")
+    else:
+        fp.write(encoder.encode(o))
 
 
 class Json:
@@ -169,3 +225,21 @@ class Json:
         :return: None
         """
         return dump(cls=_JsonEncoder, *args, **kwargs)
+
+    @staticmethod
+    def stream(o: Any, fp: IO[str], **kwargs) -> None:
+        """
+        Write a python object to a file as JSON like dump, but without building the whole document first. Each item of
+        the lists and dictionaries in the object (such as each class of a mapping database) is encoded separately by
+        the C encoder and written straight away, so memory use depends on the size of the largest item rather than the
+        whole document.
+        Indenting is not supported.
+
+        :param o: The object to write
+        :param fp: The file to write to
+        :param kwargs: The keyword arguments for the encoder, e.g. separators
+        :return: None
+        """
+        if kwargs.get("indent") is not None:
+            raise ValueError("Cannot stream indented JSON")
+        _stream(o, fp, _JsonEncoder(**kwargs))
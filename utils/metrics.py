@@ -0,0 +1,376 @@
+"""
+Counters, gauges, histograms and timers which are cheap enough to leave on in production, exported in the Prometheus text format
+"""
+
+__all__ = ['Counter', 'Gauge', 'Histogram', 'Timer', 'Registry', 'registry', 'counter', 'gauge', 'histogram', 'timer',
+           'timed', 'current_breakdown', 'add_to_breakdown']
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction, isgeneratorfunction
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    labels = [f"{name}=\"{_escape(str(value))}\"" for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    """
+    A named metric, with one series for each combination of label values
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        self.__name = name
+        self.__description = description
+        self.__labels = tuple(labels)
+        self._lock = Lock()
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def description(self) -> str:
+        return self.__description
+
+    @property
+    def labels(self) -> Tuple[str, ...]:
+        return self.__labels
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.__labels)
+
+    def series(self) -> List[Dict[str, str]]:
+        """
+        :return: The labels of every series which has been recorded
+        """
+        return []
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.__name} {_escape(self.__description)}", f"# TYPE {self.__name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    A count which only goes up
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, description, labels)
+        self.__values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = self.__values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self.__values.get(self._key(labels), 0)
+
+    def series(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = list(self.__values.keys())
+        return [dict(zip(self.labels, key)) for key in keys]
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self.__values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Gauge(Metric):
+    """
+    A value which can go up and down
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, description, labels)
+        self.__values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self.__values[key] = value
+
+    def value(self, **labels: str) -> float:
+        return self.__values.get(self._key(labels), 0)
+
+    def series(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = list(self.__values.keys())
+        return [dict(zip(self.labels, key)) for key in keys]
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self.__values.items())
+        for key, value in values:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value}"
+
+
+class Histogram(Metric):
+    """
+    Counts observations into buckets, along with their sum and count
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, description, labels)
+        self.__buckets = tuple(sorted(buckets))
+        # For each series, the count in each bucket (the last being +Inf) followed by the sum
+        self.__series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.__buckets, value)
+        with self._lock:
+            series = self.__series.get(key)
+            if series is None:
+                series = self.__series[key] = [0] * (len(self.__buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, **labels: str) -> int:
+        series = self.__series.get(self._key(labels))
+        return 0 if series is None else int(sum(series[:-1]))
+
+    def sum(self, **labels: str) -> float:
+        series = self.__series.get(self._key(labels))
+        return 0 if series is None else series[-1]
+
+    def quantile(self, quantile: float, **labels: str) -> Optional[float]:
+        """
+        :param quantile: The quantile to estimate, between 0 and 1
+        :param labels: The labels of the series
+        :return: The upper bound of the bucket the quantile falls in (infinity for the last bucket) or None if nothing
+        has been observed
+        """
+        series = self.__series.get(self._key(labels))
+        if series is None:
+            return None
+        counts = series[:-1]
+        target = quantile * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.__buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def series(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = list(self.__series.keys())
+        return [dict(zip(self.labels, key)) for key in keys]
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self.__series.items()]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.__buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = _format_labels(self.labels, key, f"le=\"{le}\"")
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {values[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class _Timing:
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]) -> None:
+        self.__histogram = histogram
+        self.__labels = labels
+        self.__start = 0.0
+
+    def __enter__(self):
+        self.__start = perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.__histogram.observe(perf_counter() - self.__start, **self.__labels)
+
+
+class Timer(Histogram):
+    """
+    A histogram of durations in seconds
+    """
+
+    def time(self, **labels: str) -> _Timing:
+        """
+        :param labels: The labels of the series to record the duration in
+        :return: A context manager which records how long its body takes
+        """
+        return _Timing(self, labels)
+
+
+class Registry:
+    """
+    Every metric which is exported, by name
+    """
+
+    def __init__(self) -> None:
+        self.__metrics: Dict[str, Metric] = {}
+        self.__lock = Lock()
+
+    def register(self, metric_type: type, name: str, description: str, labels: Sequence[str] = (), **kwargs) \
+            -> Metric:
+        """
+        Get the metric with the given name, creating it if it does not exist yet
+
+        :param metric_type: The class of the metric
+        :param name: The name of the metric
+        :param description: What the metric measures
+        :param labels: The names of the labels of the metric
+        :return: The metric
+        """
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = metric_type(name, description, labels, **kwargs)
+            elif not isinstance(metric, metric_type) or metric.labels != tuple(labels):
+                raise ValueError(f"Metric {name} is already registered as a different type")
+            return metric
+
+    @property
+    def metrics(self) -> List[Metric]:
+        with self.__lock:
+            return list(self.__metrics.values())
+
+    def render(self) -> str:
+        """
+        :return: Every metric in the Prometheus text format
+        """
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter, name, description, labels)
+
+
+def gauge(name: str, description: str, labels: Sequence[str] = ()) -> Gauge:
+    return registry.register(Gauge, name, description, labels)
+
+
+def histogram(name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) \
+        -> Histogram:
+    return registry.register(Histogram, name, description, labels, buckets=buckets)
+
+
+def timer(name: str, description: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) \
+        -> Timer:
+    return registry.register(Timer, name, description, labels, buckets=buckets)
+
+
+# The seconds spent in each category of work (e.g. database, search or discord) by whatever is being handled in this
+# context, such as a bot command. None when nothing is collecting a breakdown
+current_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("breakdown", default=None)
+
+
+def add_to_breakdown(category: str, seconds: float):
+    breakdown = current_breakdown.get()
+    if breakdown is not None:
+        breakdown[category] = breakdown.get(category, 0) + seconds
+
+
+FUNCTION_DURATION = timer("function_duration_seconds", "How long decorated functions take to run", ("function",))
+
+
+def timed(f: Optional[Callable] = None, name: Optional[str] = None, metric: Timer = FUNCTION_DURATION,
+          category: Optional[str] = None):
+    """
+    Record how long each call of the decorated function takes. The name is worked out once when decorating, so the only
+    cost of a call is reading the clock twice. Coroutine functions are timed until they return, and generator
+    functions by the time spent producing their items (not the time the caller spends between them)
+
+    >>> @timed
+    ... def example_function():
+    ...     pass
+
+    :param f: The function to time
+    :param name: The name to record the function under (default - its module and qualified name)
+    :param metric: The timer to record in, which must have a single function label
+    :param category: The category of the current breakdown to add the time to (default - not added to any)
+    :return: The wrapper of the function
+    """
+
+    def decorator(func: Callable) -> Callable:
+        labels = {"function": name or f"{func.__module__}.{func.__qualname__}"}
+
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    elapsed = perf_counter() - start
+                    metric.observe(elapsed, **labels)
+                    if category is not None:
+                        add_to_breakdown(category, elapsed)
+        elif isgeneratorfunction(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                elapsed = 0.0
+                generator = func(*args, **kwargs)
+                try:
+                    while True:
+                        start = perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration as e:
+                            return e.value
+                        finally:
+                            step = perf_counter() - start
+                            elapsed += step
+                            # Added a step at a time, as the generator may be closed outside of the context using it
+                            if category is not None:
+                                add_to_breakdown(category, step)
+                        yield item
+                finally:
+                    generator.close()
+                    metric.observe(elapsed, **labels)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed = perf_counter() - start
+                    metric.observe(elapsed, **labels)
+                    if category is not None:
+                        add_to_breakdown(category, elapsed)
+        return wrapper
+
+    return decorator(f) if f is not None else decorator
@@ -0,0 +1,111 @@
+"""
+A store for pastes on the local disk, shared by the bot which uploads them and the website which serves them
+"""
+
+__all__ = ['PasteStore']
+
+from gzip import compress, decompress
+from hashlib import sha256
+from json import loads, dumps
+from pathlib import Path
+from re import compile
+from time import time
+from typing import Any, Dict, Optional
+from utils import atomic_write
+
+
+KEY = compile(r"^[0-9a-f]{64}$")
+
+
+class PasteStore:
+    """
+    Stores each paste compressed on disk under the hash of its content, alongside a small file with its name and when
+    it expires. Uploading the same content twice stores it once
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.__path = path
+
+    @staticmethod
+    def is_key(key: str) -> bool:
+        return KEY.match(key) is not None
+
+    def __blob(self, key: str) -> Path:
+        return self.__path / key[:2] / f"{key}.gz"
+
+    def __meta(self, key: str) -> Path:
+        return self.__path / key[:2] / f"{key}.json"
+
+    @staticmethod
+    def __write(path: Path, data: bytes):
+        with atomic_write(path, "wb") as f:
+            f.write(data)
+
+    def put(self, content: bytes, name: str, expiry: float) -> str:
+        """
+        Store the given content, extending its expiry if it is already stored
+
+        :param content: The content of the paste
+        :param name: The file name of the paste
+        :param expiry: How long, in seconds, the paste should be kept
+        :return: The key of the paste
+        """
+        key = sha256(content).hexdigest()
+        blob = self.__blob(key)
+        meta = self.meta(key)
+        if meta is None or not blob.exists():
+            self.__write(blob, compress(content))
+            meta = {"name": name, "size": len(content), "created": time()}
+        meta["expires"] = max(meta.get("expires", 0), time() + expiry)
+        self.__write(self.__meta(key), dumps(meta).encode("utf-8"))
+        return key
+
+    def meta(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        :param key: The key of the paste
+        :return: The name, size, creation and expiry time of the paste or None if it is not stored or has expired
+        """
+        if not self.is_key(key):
+            return None
+        try:
+            meta = loads(self.__meta(key).read_text())
+        except (OSError, ValueError):
+            return None
+        if meta["expires"] <= time():
+            return None
+        return meta
+
+    def compressed(self, key: str) -> bytes:
+        """
+        :param key: The key of the paste
+        :return: The gzip compressed content of the paste
+        """
+        return self.__blob(key).read_bytes()
+
+    def read(self, key: str) -> bytes:
+        """
+        :param key: The key of the paste
+        :return: The content of the paste
+        """
+        return decompress(self.compressed(key))
+
+    def expire(self) -> int:
+        """
+        Delete every paste which has expired
+
+        :return: The number of pastes deleted
+        """
+        if not self.__path.exists():
+            return 0
+        removed = 0
+        now = time()
+        for meta_file in self.__path.glob("*/*.json"):
+            try:
+                expired = loads(meta_file.read_text())["expires"] <= now
+            except (OSError, ValueError, KeyError):
+                expired = True
+            if expired:
+                self.__blob(meta_file.stem).unlink(missing_ok=True)
+                meta_file.unlink(missing_ok=True)
+                removed += 1
+        return removed
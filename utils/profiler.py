@@ -0,0 +1,134 @@
+"""
+A sampling profiler which can be started and stopped while the bot and website are running. It writes collapsed stacks,
+one line per distinct stack with the number of samples it was seen in, which flamegraph tools can read directly
+"""
+
+__all__ = ['SamplingProfiler', 'profiler']
+
+import sys
+from logging import getLogger
+from pathlib import Path
+from threading import Event, Lock, Thread, enumerate as enumerate_threads, get_ident
+from time import monotonic, strftime
+from typing import Dict, Optional
+from utils import atomic_write
+
+
+logger = getLogger("profiler")
+
+
+def _collapse(frame, thread_name: str) -> str:
+    """
+    :param frame: The innermost frame of a thread
+    :param thread_name: The name of the thread, used as the root of the stack
+    :return: The stack from the root to the innermost frame, separated by semicolons
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})".replace(";", ":"))
+        frame = frame.f_back
+    names.append(thread_name.replace(";", ":"))
+    names.reverse()
+    return ";".join(names)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread (the bot's event loop, the website's threads and any executor threads) at a fixed
+    interval for a bounded window. Only one profile runs at a time
+    """
+
+    def __init__(self) -> None:
+        self.__lock = Lock()
+        self.__stopping = Event()
+        self.__thread: Optional[Thread] = None
+        self.__output: Optional[Path] = None
+        self.__started: Optional[float] = None
+        self.__duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        thread = self.__thread
+        return thread is not None and thread.is_alive()
+
+    @property
+    def output(self) -> Optional[Path]:
+        """
+        :return: The file the current or last profile is written to or None if no profile has run
+        """
+        return self.__output
+
+    @property
+    def remaining(self) -> float:
+        """
+        :return: How long, in seconds, until the current profile stops by itself
+        """
+        if not self.running:
+            return 0
+        return max(self.__started + self.__duration - monotonic(), 0)
+
+    def start(self, directory: Path, duration: float, interval: float) -> Optional[Path]:
+        """
+        Start profiling in the background
+
+        :param directory: The directory to write the collapsed stacks to
+        :param duration: How long, in seconds, to profile for unless stopped earlier
+        :param interval: How long, in seconds, between samples
+        :return: The file the collapsed stacks will be written to or None if a profile is already running
+        """
+        with self.__lock:
+            if self.running:
+                return None
+            self.__output = directory / f"profile-{strftime('%Y%m%d-%H%M%S')}.collapsed"
+            self.__started = monotonic()
+            self.__duration = duration
+            self.__stopping.clear()
+            self.__thread = Thread(target=self.__run, args=(self.__output, duration, interval), name="profiler",
+                                   daemon=True)
+            self.__thread.start()
+            logger.info(f"Profiling for {duration}s into {self.__output}")
+            return self.__output
+
+    def stop(self) -> Optional[Path]:
+        """
+        Stop the current profile, blocking until its collapsed stacks have been written
+
+        :return: The file the collapsed stacks were written to or None if no profile was running
+        """
+        with self.__lock:
+            thread = self.__thread
+            if thread is None or not thread.is_alive():
+                return None
+            self.__stopping.set()
+        thread.join()
+        return self.__output
+
+    def __run(self, output: Path, duration: float, interval: float):
+        stacks: Dict[str, int] = {}
+        samples = 0
+        own_thread = get_ident()
+        deadline = monotonic() + duration
+        while monotonic() < deadline and not self.__stopping.wait(interval):
+            thread_names = {thread.ident: thread.name for thread in enumerate_threads()}
+            # noinspection PyProtectedMember
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_thread:
+                    stack = _collapse(frame, thread_names.get(thread_id, str(thread_id)))
+                    stacks[stack] = stacks.get(stack, 0) + 1
+            samples += 1
+        try:
+            self.__write(output, stacks)
+            logger.info(f"Wrote {samples} samples of {len(stacks)} distinct stacks to {output}")
+        except OSError as e:
+            logger.error(f"Failed to write profile to {output}")
+            logger.exception(e)
+
+    @staticmethod
+    def __write(output: Path, stacks: Dict[str, int]):
+        with atomic_write(output, encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items(), key=lambda item: item[1], reverse=True):
+                f.write(f"{stack} {count}\n")
+
+
+profiler = SamplingProfiler()
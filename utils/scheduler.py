@@ -0,0 +1,177 @@
+"""
+An async scheduler which sleeps until the next job is due rather than polling
+"""
+
+__all__ = ['Job', 'Scheduler', 'scheduler']
+
+from asyncio import Event, TimeoutError, ensure_future, wait_for
+from heapq import heappush, heappop
+from itertools import count
+from logging import getLogger
+from random import uniform
+from time import monotonic, time
+from typing import Awaitable, Callable, List, Optional
+
+
+logger = getLogger("scheduler")
+
+
+class Job:
+    """
+    A coroutine function which is run every interval
+    """
+
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float, timeout: Optional[float],
+                 jitter: float) -> None:
+        self.__name = name
+        self.__func = func
+        self.__interval = interval
+        self.__timeout = timeout
+        self.__jitter = jitter
+        self.__due = 0.0
+        self.__running = False
+        self.__last_run: Optional[float] = None
+        self.__last_duration: Optional[float] = None
+        self.__last_error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @property
+    def interval(self) -> float:
+        return self.__interval
+
+    @property
+    def due(self) -> float:
+        """
+        :return: When, on the monotonic clock, the job is next due
+        """
+        return self.__due
+
+    @due.setter
+    def due(self, due: float):
+        self.__due = due
+
+    @property
+    def running(self) -> bool:
+        return self.__running
+
+    @property
+    def next_run(self) -> Optional[float]:
+        """
+        :return: When, as a unix timestamp, the job will next run or None if it is running
+        """
+        if self.__running:
+            return None
+        return time() + max(self.__due - monotonic(), 0)
+
+    @property
+    def last_run(self) -> Optional[float]:
+        """
+        :return: When, as a unix timestamp, the job last started or None if it has not run yet
+        """
+        return self.__last_run
+
+    @property
+    def last_duration(self) -> Optional[float]:
+        """
+        :return: How long, in seconds, the last run took or None if it has not finished a run yet
+        """
+        return self.__last_duration
+
+    @property
+    def last_error(self) -> Optional[str]:
+        """
+        :return: Why the last run failed or None if it succeeded
+        """
+        return self.__last_error
+
+    def next_due(self, started: float) -> float:
+        return max(started + self.__interval, monotonic()) + uniform(0, self.__jitter)
+
+    async def run(self):
+        self.__running = True
+        self.__last_run = time()
+        start = monotonic()
+        try:
+            await wait_for(self.__func(), self.__timeout)
+            self.__last_error = None
+        except TimeoutError:
+            self.__last_error = f"Timed out after {self.__timeout}s"
+            logger.error(f"Job {self.__name} timed out after {self.__timeout}s")
+        except Exception as e:
+            self.__last_error = repr(e)
+            logger.error(f"Job {self.__name} failed")
+            logger.exception(e)
+        finally:
+            self.__last_duration = monotonic() - start
+            self.__running = False
+
+
+class Scheduler:
+    """
+    Keeps jobs in a heap ordered by when they are next due and sleeps until the first one is. Due jobs run
+    concurrently, and a job is only scheduled again once its run has finished so runs of one job never overlap
+    """
+
+    def __init__(self) -> None:
+        self.__heap = []
+        self.__jobs: List[Job] = []
+        # Breaks ties between jobs due at the same time
+        self.__counter = count()
+        self.__wakeup: Optional[Event] = None
+
+    @property
+    def jobs(self) -> List[Job]:
+        return list(self.__jobs)
+
+    def __push(self, job: Job):
+        heappush(self.__heap, (job.due, next(self.__counter), job))
+        if self.__wakeup is not None:
+            self.__wakeup.set()
+
+    def every(self, interval: float, func: Callable[[], Awaitable], name: Optional[str] = None,
+              timeout: Optional[float] = None, jitter: float = 0, run_now: bool = False) -> Job:
+        """
+        Schedule the given coroutine function to run every interval
+
+        :param interval: How long, in seconds, between the start of one run and the start of the next
+        :param func: The coroutine function to run
+        :param name: The name of the job (default - the name of the function)
+        :param timeout: How long, in seconds, a run may take before it is cancelled (default - no limit)
+        :param jitter: The most, in seconds, which is randomly added to the time of each run
+        :param run_now: Whether the first run happens as soon as the scheduler is running rather than after an interval
+        :return: The job
+        """
+        job = Job(name or func.__name__, func, interval, timeout, jitter)
+        job.due = monotonic() if run_now else job.next_due(monotonic())
+        self.__jobs.append(job)
+        self.__push(job)
+        return job
+
+    async def __run_job(self, job: Job):
+        started = monotonic()
+        await job.run()
+        job.due = job.next_due(started)
+        self.__push(job)
+
+    async def run(self):
+        """
+        Run jobs as they become due, forever
+        """
+        self.__wakeup = Event()
+        while True:
+            self.__wakeup.clear()
+            now = monotonic()
+            while self.__heap and self.__heap[0][0] <= now:
+                ensure_future(self.__run_job(heappop(self.__heap)[2]))
+            delay = self.__heap[0][0] - now if self.__heap else None
+            try:
+                # Woken early when a job is added or rescheduled
+                await wait_for(self.__wakeup.wait(), delay)
+            except TimeoutError:
+                pass
+
+
+scheduler = Scheduler()
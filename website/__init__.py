@@ -1,8 +1,19 @@
 from threading import Thread
 
 
+def serve(app):
+    host = app.config["WEBSITE_HOST"]
+    port = app.config["WEBSITE_PORT"]
+    if app.config["WEBSITE_SERVER"] == "waitress":
+        from waitress import serve as waitress_serve
+        # Keep the number of worker threads bounded so API traffic cannot starve the bot's event loop
+        waitress_serve(app, host=host, port=port, threads=app.config["WEBSITE_THREADS"])
+    else:
+        app.run(host=host, port=port)
+
+
 def run(app):
     from .views import register
     register(app)
-    Thread(target=app.run, kwargs={"host": "0.0.0.0", "port": 8080}).start()
-    print("Started website")
+    Thread(target=serve, args=(app,)).start()
+    print(f"Started website using the {app.config['WEBSITE_SERVER']} server")
@@ -6,3 +6,11 @@ def register(app):
     from .api import api_blueprint
 
     app.register_blueprint(api_blueprint, url_prefix="/api")
+
+    from .paste import paste
+
+    app.register_blueprint(paste)
+
+    from .metrics import metrics
+
+    app.register_blueprint(metrics)
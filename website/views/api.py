@@ -1,9 +1,20 @@
-from flask import Blueprint
-from flask_restful import Api, Resource, reqparse, fields, marshal_with
-
-from bot import InvalidVersion
-from bot.mappings import resolve_version, search_all
-from bot.mappings.downloader import MCPDownloader, MappingType
+from flask import Blueprint, Response, current_app, request, send_file
+from flask_restful import Api, Resource, reqparse, fields, abort
+from csv import writer
+from hmac import compare_digest
+from io import StringIO
+from json import dumps
+from pathlib import Path
+from typing import List
+from weakref import WeakKeyDictionary
+from zlib import compressobj, MAX_WBITS
+
+from bot import InvalidVersion, MappingsLoading
+from bot.mappings import get_database as find_database, resolve_version, search_all
+from bot.mappings.downloader import MappingDatabase, MappingType
+from sync import sync_history
+from utils.profiler import profiler
+from utils.scheduler import scheduler
 
 
 api_blueprint = Blueprint("api", __name__, url_prefix="/api")
@@ -16,6 +27,33 @@ search_parser.add_argument("s", dest="search", required=False, help="The search
 search_parser.add_argument("page", default=0, type=int, required=False, help="Which page of results to fetch")
 
 
+class_parser = search_parser.copy()
+class_parser.add_argument("fields", required=False,
+                          help="Comma separated list of the attributes to return for each class (default - all)")
+class_parser.add_argument("depth", default="full", choices=("full", "shallow"), required=False,
+                          help="Whether to include the fields, methods and constructors of each class")
+
+
+members_parser = reqparse.RequestParser()
+members_parser.add_argument("mc", required=False, default="latest", help="The Minecraft version to use")
+members_parser.add_argument("name", required=True, help="The intermediate name of the class")
+members_parser.add_argument("type", default="methods", choices=("fields", "methods", "constructors"),
+                            required=False, help="Which members of the class to fetch")
+
+
+export_parser = reqparse.RequestParser()
+export_parser.add_argument("mc", required=False, default="latest", help="The Minecraft version to use")
+export_parser.add_argument("format", default="ndjson", choices=("ndjson", "csv", "tsrg"), required=False,
+                           help="The format of the export (ndjson, csv or tsrg)")
+
+sync_parser = reqparse.RequestParser()
+sync_parser.add_argument("limit", default=20, type=int, required=False, help="How many of the latest runs to fetch")
+
+profile_parser = reqparse.RequestParser()
+profile_parser.add_argument("duration", default=60, type=float, required=False,
+                            help="How long, in seconds, to profile for unless stopped earlier")
+
+
 class EnumField(fields.Raw):
     def format(self, value):
         return value.name
@@ -70,12 +108,132 @@ search_fields = {
 }
 
 
+class Serializer:
+    """
+    Encodes objects straight to JSON using a set of flask_restful fields which is compiled once, rather than walking
+    the fields through marshal for every object. The encoded form of each object is cached, so encoding a result
+    which has already been served is a join of ready-made bytes
+    """
+
+    __compiled = {}
+
+    def __init__(self, field_spec: dict, cache: bool = True) -> None:
+        self.__parts = []
+        for key, field in field_spec.items():
+            if isinstance(field, type):
+                field = field()
+            attribute = field.attribute if field.attribute is not None else key
+            prefix = dumps(key).encode("utf-8") + b":"
+            if isinstance(field, fields.List):
+                nested = Serializer.compiled(field.container.nested, cache)
+                self.__parts.append((key, prefix, attribute, nested.encode_list))
+            elif isinstance(field, EnumField):
+                self.__parts.append((key, prefix, attribute, Serializer.__encode_enum))
+            else:
+                self.__parts.append((key, prefix, attribute, Serializer.__encode_value))
+        self.__cache = WeakKeyDictionary() if cache else None
+
+    @staticmethod
+    def compiled(field_spec: dict, cache: bool = True) -> 'Serializer':
+        """
+        Get the shared serializer for the given fields, so that nested results share one cache
+
+        :param field_spec: The flask_restful fields
+        :param cache: Whether the serializer caches the encoded objects
+        :return: The serializer
+        """
+        key = (id(field_spec), cache)
+        if key not in Serializer.__compiled.keys():
+            Serializer.__compiled[key] = Serializer(field_spec, cache)
+        return Serializer.__compiled[key]
+
+    @property
+    def keys(self) -> List[str]:
+        return [part[0] for part in self.__parts]
+
+    def project(self, keys: List[str]) -> 'Serializer':
+        """
+        Create a serializer which only encodes the given keys. Projections do not cache the objects they encode as
+        the nested results are still cached by the shared serializers
+
+        :param keys: The keys to keep
+        :return: The projected serializer
+        """
+        projection = Serializer({}, cache=False)
+        projection.__parts = [part for part in self.__parts if part[0] in keys]
+        return projection
+
+    @staticmethod
+    def __encode_enum(value) -> bytes:
+        return b"null" if value is None else dumps(value.name).encode("utf-8")
+
+    @staticmethod
+    def __encode_value(value) -> bytes:
+        return b"null" if value is None else dumps(str(value)).encode("utf-8")
+
+    def encode(self, o) -> bytes:
+        """
+        Encode the given object as a JSON object
+
+        :param o: The object (or dictionary) to encode
+        :return: The encoded object
+        """
+        if isinstance(o, dict):
+            values = [prefix + encode(o.get(attribute)) for _, prefix, attribute, encode in self.__parts]
+            return b"{" + b",".join(values) + b"}"
+        if self.__cache is not None:
+            fragment = self.__cache.get(o)
+            if fragment is not None:
+                return fragment
+        values = [prefix + encode(getattr(o, attribute, None)) for _, prefix, attribute, encode in self.__parts]
+        fragment = b"{" + b",".join(values) + b"}"
+        if self.__cache is not None:
+            self.__cache[o] = fragment
+        return fragment
+
+    def encode_list(self, values) -> bytes:
+        """
+        Encode the given objects as a JSON array
+
+        :param values: The objects to encode
+        :return: The encoded array
+        """
+        if values is None:
+            return b"null"
+        return b"[" + b",".join(map(self.encode, values)) + b"]"
+
+
+parameter_serializer = Serializer.compiled(parameter_fields)
+method_serializer = Serializer.compiled(method_fields)
+field_serializer = Serializer.compiled(field_fields)
+class_serializer = Serializer.compiled(class_fields)
+search_serializer = Serializer.compiled(search_fields)
+# Exports walk every class in a version, so they must not fill the cache
+export_class_serializer = Serializer.compiled(class_fields, cache=False)
+
+CLASS_MEMBERS = {
+    "fields": field_serializer,
+    "methods": method_serializer,
+    "constructors": method_serializer
+}
+
+
+def json_response(data: bytes) -> Response:
+    return Response(data + b"\n", mimetype="application/json")
+
+
 PAGE_SIZE = 5
 
 
+def get_database(version: str) -> MappingDatabase:
+    try:
+        return find_database(version)
+    except MappingsLoading:
+        abort(503, message=f"The mappings for {version} are still loading")
+
+
 @api.resource("/mcp")
 class SearchMCPResource(Resource):
-    @marshal_with(search_fields)
     def get(self):
         search_args = search_parser.parse_args()
         version = resolve_version(search_args["mc"])
@@ -84,51 +242,77 @@ class SearchMCPResource(Resource):
             if search_args["search"] is None:
                 return {}
 
+            database = get_database(version)
             results = []
             count = 0
-            for result in search_all(search_args["search"], version):
+            for result in search_all(search_args["search"], database):
                 if count > PAGE_SIZE * (page + 1):
                     break
                 if count > PAGE_SIZE * page:
                     results.append(result)
                 count += 1
-            return {
+            return json_response(search_serializer.encode({
                 "fields": list(filter(lambda r: r.mapping_type == MappingType.FIELD, results)),
                 "methods": list(filter(lambda r: r.mapping_type == MappingType.METHOD, results)),
                 "parameters": list(filter(lambda r: r.mapping_type == MappingType.PARAMETER, results)),
                 "classes": list(filter(lambda r: r.mapping_type == MappingType.CLASS, results)),
-            }
+            }))
 
         raise InvalidVersion("", search_args["mc"])
 
 
 @api.resource("/mcp/class")
 class SearchMCPClassResource(Resource):
-    @marshal_with(class_fields)
     def get(self):
-        search_args = search_parser.parse_args()
+        search_args = class_parser.parse_args()
         version = resolve_version(search_args["mc"])
         page = search_args["page"]
         if version is not None:
             if search_args["search"] is None:
                 return {}
 
+            serializer = class_serializer
+            if search_args["fields"] is not None or search_args["depth"] == "shallow":
+                keys = serializer.keys
+                if search_args["fields"] is not None:
+                    keys = [key.strip() for key in search_args["fields"].split(",")]
+                    invalid = [key for key in keys if key not in serializer.keys]
+                    if len(invalid) > 0:
+                        abort(400, message=f"Unknown fields {', '.join(invalid)}")
+                if search_args["depth"] == "shallow":
+                    keys = [key for key in keys if key not in CLASS_MEMBERS.keys()]
+                serializer = serializer.project(keys)
+
             results = []
             count = 0
-            for result in MCPDownloader.database[version].search_classes(search_args["search"]):
+            for result in get_database(version).search_classes(search_args["search"]):
                 if count > PAGE_SIZE * (page + 1):
                     break
                 if count > PAGE_SIZE * page:
                     results.append(result)
                 count += 1
-            return results
+            return json_response(serializer.encode_list(results))
 
         raise InvalidVersion("", search_args["mc"])
 
 
+@api.resource("/mcp/class/members")
+class MCPClassMembersResource(Resource):
+    def get(self):
+        members_args = members_parser.parse_args()
+        version = resolve_version(members_args["mc"])
+        if version is not None:
+            clazz = get_database(version).get_class(members_args["name"])
+            if clazz is None:
+                abort(404, message=f"Cannot find class {members_args['name']}")
+            member_type = members_args["type"]
+            return json_response(CLASS_MEMBERS[member_type].encode_list(getattr(clazz, member_type)))
+
+        raise InvalidVersion("", members_args["mc"])
+
+
 @api.resource("/mcp/field")
 class SearchMCPFieldResource(Resource):
-    @marshal_with(field_fields)
     def get(self):
         search_args = search_parser.parse_args()
         version = resolve_version(search_args["mc"])
@@ -139,20 +323,19 @@ class SearchMCPFieldResource(Resource):
 
             results = []
             count = 0
-            for result in MCPDownloader.database[version].search_field(search_args["search"]):
+            for result in get_database(version).search_field(search_args["search"]):
                 if count > PAGE_SIZE * (page + 1):
                     break
                 if count > PAGE_SIZE * page:
                     results.append(result)
                 count += 1
-            return results
+            return json_response(field_serializer.encode_list(results))
 
         raise InvalidVersion("", search_args["mc"])
 
 
 @api.resource("/mcp/method")
 class SearchMCPMethodResource(Resource):
-    @marshal_with(method_fields)
     def get(self):
         search_args = search_parser.parse_args()
         version = resolve_version(search_args["mc"])
@@ -163,20 +346,19 @@ class SearchMCPMethodResource(Resource):
 
             results = []
             count = 0
-            for result in MCPDownloader.database[version].search_method(search_args["search"]):
+            for result in get_database(version).search_method(search_args["search"]):
                 if count > PAGE_SIZE * (page + 1):
                     break
                 if count > PAGE_SIZE * page:
                     results.append(result)
                 count += 1
-            return results
+            return json_response(method_serializer.encode_list(results))
 
         raise InvalidVersion("", search_args["mc"])
 
 
 @api.resource("/mcp/parameter")
 class SearchMCPParameterResource(Resource):
-    @marshal_with(parameter_fields)
     def get(self):
         search_args = search_parser.parse_args()
         version = resolve_version(search_args["mc"])
@@ -187,12 +369,187 @@ class SearchMCPParameterResource(Resource):
 
             results = []
             count = 0
-            for result in MCPDownloader.database[version].search_parameters(search_args["search"]):
+            for result in get_database(version).search_parameters(search_args["search"]):
                 if count > PAGE_SIZE * (page + 1):
                     break
                 if count > PAGE_SIZE * page:
                     results.append(result)
                 count += 1
-            return results
+            return json_response(parameter_serializer.encode_list(results))
 
         raise InvalidVersion("", search_args["mc"])
+
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_MIME_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "tsrg": "text/plain"
+}
+
+
+def export_ndjson(database):
+    for clazz in database.classes:
+        yield export_class_serializer.encode(clazz) + b"\n"
+
+
+def export_csv(database):
+    buffer = StringIO()
+    csv = writer(buffer)
+    csv.writerow(["type", "class", "original_name", "intermediate_name", "name", "signature", "physical_side",
+                  "description"])
+    for clazz in database.classes:
+        csv.writerow([clazz.mapping_type.name, clazz.intermediate_name, clazz.original_name,
+                      clazz.intermediate_name, clazz.name, None, None, clazz.description])
+        for field in clazz.fields:
+            csv.writerow([field.mapping_type.name, clazz.intermediate_name, field.original_name,
+                          field.intermediate_name, field.name, None, field.side.name, field.description])
+        for method in clazz.constructors + clazz.methods:
+            csv.writerow([method.mapping_type.name, clazz.intermediate_name, method.original_name,
+                          method.intermediate_name, method.name, method.signature, method.side.name,
+                          method.description])
+            for parameter in method.parameters:
+                csv.writerow([parameter.mapping_type.name, clazz.intermediate_name, parameter.original_name,
+                              parameter.intermediate_name, parameter.name, None, parameter.side.name,
+                              parameter.description])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def export_tsrg(database):
+    for clazz in database.classes:
+        lines = [f"{clazz.original_name} {clazz.intermediate_name}"]
+        for field in clazz.fields:
+            lines.append(f"\t{field.original_name} {field.intermediate_name}")
+        for method in clazz.methods:
+            if method.original_name is not None:
+                lines.append(f"\t{method.original_name} {method.signature} {method.intermediate_name}")
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+EXPORTERS = {
+    "ndjson": export_ndjson,
+    "csv": export_csv,
+    "tsrg": export_tsrg
+}
+
+
+def chunked(lines):
+    """
+    Group the exported lines into chunks of roughly EXPORT_CHUNK_SIZE bytes so that the response is not written one
+    line at a time
+
+    :param lines: The encoded lines
+    :return: The chunks
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if len(buffer) > 0:
+        yield b"".join(buffer)
+
+
+def gzipped(chunks):
+    compressor = compressobj(wbits=MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if len(data) > 0:
+            yield data
+    yield compressor.flush()
+
+
+@api.resource("/mcp/export")
+class ExportMCPResource(Resource):
+    def get(self):
+        export_args = export_parser.parse_args()
+        version = resolve_version(export_args["mc"])
+        if version is not None:
+            export_format = export_args["format"]
+            body = chunked(EXPORTERS[export_format](get_database(version)))
+            headers = {
+                "Content-Disposition": f"attachment; filename=mcp-{version}.{export_format}",
+                "Vary": "Accept-Encoding"
+            }
+            if "gzip" in request.accept_encodings:
+                body = gzipped(body)
+                headers["Content-Encoding"] = "gzip"
+            return Response(body, mimetype=EXPORT_MIME_TYPES[export_format], headers=headers)
+
+        raise InvalidVersion("", export_args["mc"])
+
+
+@api.resource("/sync")
+class SyncResource(Resource):
+    def get(self):
+        sync_args = sync_parser.parse_args()
+        limit = max(sync_args["limit"], 0)
+        runs = sync_history.runs[-limit:] if limit > 0 else []
+        return {
+            "jobs": [{
+                "name": job.name,
+                "interval": job.interval,
+                "running": job.running,
+                "next_run": job.next_run,
+                "last_run": job.last_run,
+                "last_duration": job.last_duration,
+                "last_error": job.last_error
+            } for job in scheduler.jobs],
+            "runs": runs[::-1]
+        }
+
+
+def check_profile_token():
+    token = current_app.config["PROFILE_TOKEN"]
+    # Hidden entirely unless a token has been configured
+    if not token:
+        abort(404)
+    given = request.headers.get("Authorization", "")
+    if not compare_digest(given.encode(), f"Bearer {token}".encode()):
+        abort(401, message="A valid profiler token is required")
+
+
+def profile_status() -> dict:
+    return {
+        "running": profiler.running,
+        "remaining": profiler.remaining,
+        "output": None if profiler.output is None else str(profiler.output)
+    }
+
+
+@api.resource("/profile")
+class ProfileResource(Resource):
+    def get(self):
+        check_profile_token()
+        return profile_status()
+
+    def post(self):
+        check_profile_token()
+        profile_args = profile_parser.parse_args()
+        duration = min(max(profile_args["duration"], 1), current_app.config["PROFILE_MAX_SECONDS"])
+        if profiler.start(Path(current_app.config["PROFILE_DIR"]), duration,
+                          current_app.config["PROFILE_INTERVAL"]) is None:
+            abort(409, message="A profile is already running")
+        return profile_status(), 202
+
+    def delete(self):
+        check_profile_token()
+        if profiler.stop() is None:
+            abort(409, message="No profile is running")
+        return profile_status()
+
+
+@api.resource("/profile/output")
+class ProfileOutputResource(Resource):
+    def get(self):
+        check_profile_token()
+        output = profiler.output
+        if output is None or profiler.running or not output.exists():
+            abort(404, message="No finished profile to download")
+        return send_file(str(output), mimetype="text/plain", as_attachment=True, attachment_filename=output.name)
@@ -0,0 +1,32 @@
+from flask import Blueprint, Response, request, g
+from time import perf_counter
+
+from utils.metrics import registry, counter, timer
+
+metrics = Blueprint('metrics', __name__)
+
+
+REQUESTS = counter("http_requests_total", "How many requests the website has answered", ("endpoint", "method", "status"))
+REQUEST_TIME = timer("http_request_duration_seconds", "How long the website takes to answer requests",
+                     ("endpoint", "method"))
+
+
+@metrics.before_app_request
+def start_timer():
+    g.request_start = perf_counter()
+
+
+@metrics.after_app_request
+def record_request(response):
+    start = g.pop("request_start", None)
+    if start is not None and request.endpoint != "metrics.export_metrics":
+        # Label by endpoint rather than path so that every search term does not create a new series
+        endpoint = request.endpoint or "unknown"
+        REQUEST_TIME.observe(perf_counter() - start, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
+
+
+@metrics.route("/metrics")
+def export_metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
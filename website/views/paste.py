@@ -0,0 +1,50 @@
+from flask import Blueprint, Response, request, current_app, abort
+from pathlib import Path
+from time import time
+from werkzeug.urls import url_quote
+
+from utils.paste import PasteStore
+
+paste = Blueprint('paste', __name__)
+
+
+def content_disposition(name: str) -> str:
+    """
+    :param name: The file name given by the uploader
+    :return: The Content-Disposition header for the name, with an ASCII fallback for clients without RFC 5987 support as
+    headers must be latin-1
+    """
+    fallback = "".join(c if 32 <= ord(c) < 127 and c not in '"\\' else "_" for c in name)
+    return f"inline; filename=\"{fallback}\"; filename*=UTF-8''{url_quote(name, safe='')}"
+
+
+@paste.route("/paste/<key>")
+def view_paste(key: str):
+    store = PasteStore(Path(current_app.config["PASTE_STORE"]))
+    meta = store.meta(key)
+    if meta is None:
+        abort(404)
+    # Pastes never change, so they can be cached until they expire
+    max_age = max(int(meta["expires"] - time()), 0)
+    try:
+        if "gzip" in request.accept_encodings and "Range" not in request.headers:
+            # Send the stored blob as it is rather than decompressing it
+            response = Response(store.compressed(key), mimetype="text/plain")
+            response.headers["Content-Encoding"] = "gzip"
+            response.set_etag(f"{key}-gzip")
+        else:
+            response = Response(store.read(key), mimetype="text/plain")
+            response.set_etag(key)
+            response.accept_ranges = "bytes"
+    except FileNotFoundError:
+        # Expired and deleted since its metadata was read
+        abort(404)
+    response.headers["Content-Disposition"] = content_disposition(meta["name"])
+    response.vary.add("Accept-Encoding")
+    response.last_modified = meta["created"]
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = True
+    if "Content-Encoding" in response.headers:
+        return response.make_conditional(request)
+    return response.make_conditional(request, accept_ranges=True, complete_length=meta["size"])